@@ -1,22 +1,97 @@
 import os
-import json
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
+import time
+import asyncio
+import httpx
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete, update, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from pydantic import BaseModel
+from sqlalchemy.orm import joinedload
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 from typing import Optional
+from datetime import datetime
 
 from app.db.database import get_async_session
 from app.db.models import User, Channel, Subscription, Post
-from app.services.userbot import get_userbot_service, AuthState
+from app.services.userbot import get_userbot_service, AuthState, UserbotService
 from app.services import settings as app_settings
 
 router = APIRouter(prefix="/api", tags=["api"])
 
 
+# =============================================================================
+# RESPONSE CACHE
+# =============================================================================
+# In-memory кеш ответов для редко меняющихся GET эндпоинтов.
+# Дашборд опрашивает их постоянно, а данные меняются редко —
+# повторные хиты отдаём из памяти вместо похода в Postgres / Google.
+_response_cache: dict[str, tuple[float, object]] = {}
+
+
+# =============================================================================
+# PREBUILT STATEMENTS
+# =============================================================================
+# Запросы строятся один раз при импорте — SQLAlchemy переиспользует
+# скомпилированную форму из query cache вместо пересборки на каждый запрос.
+# Счётчики точные: один round-trip + TTL-кеш сверху это уже дешёво.
+# Приближённые значения из pg_stat_user_tables.n_live_tup здесь не
+# подходят — на маленьких таблицах они показывают 0 до первого
+# autovacuum/analyze, и дашборд врал бы.
+_STMT_STATS = select(
+    select(func.count(User.id)).scalar_subquery(),
+    select(func.count(Channel.id)).scalar_subquery(),
+    select(func.count(Subscription.id)).scalar_subquery(),
+    select(func.count(Post.id)).scalar_subquery(),
+)
+_STMT_USERS = select(User).order_by(User.created_at.desc())
+_STMT_CHANNELS = select(Channel).order_by(Channel.created_at.desc())
+# Для many-to-one связей joinedload даёт один запрос с LEFT JOIN
+# вместо дополнительных IN-запросов от selectinload
+_STMT_SUBSCRIPTIONS = (
+    select(Subscription)
+    .options(joinedload(Subscription.user), joinedload(Subscription.channel))
+    .order_by(Subscription.created_at.desc())
+)
+# Превью контента режется на стороне Postgres (substr), чтобы
+# многокилобайтные посты не гонялись по сети целиком
+_STMT_POSTS = (
+    select(
+        Post.id,
+        Post.channel_id,
+        Post.post_id,
+        func.substr(Post.content, 1, 501).label("content"),
+        Post.summary,
+        Post.created_at,
+        Channel.username.label("channel_username"),
+        Channel.title.label("channel_title"),
+    )
+    .join(Channel, Post.channel_id == Channel.id, isouter=True)
+    .order_by(Post.created_at.desc(), Post.id.desc())
+)
+
+
+def _cache_get(key: str, ttl: float):
+    """Возвращает закешированное значение или None если устарело"""
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    cached_at, value = entry
+    if time.monotonic() - cached_at > ttl:
+        return None
+    return value
+
+
+def _cache_set(key: str, value) -> None:
+    _response_cache[key] = (time.monotonic(), value)
+
+
+def _cache_invalidate(*keys: str) -> None:
+    """Сбрасывает кеш после изменения данных (включая ключи с параметрами)"""
+    for key in keys:
+        for cached_key in list(_response_cache):
+            if cached_key == key or cached_key.startswith(key + ":"):
+                _response_cache.pop(cached_key, None)
+
+
 # Pydantic models
 class StatsResponse(BaseModel):
     total_users: int
@@ -25,6 +100,69 @@ class StatsResponse(BaseModel):
     total_posts: int
 
 
+# Модели списковых ответов: сериализация ORM-объектов выполняется
+# batch'ем в pydantic-core (Rust) вместо ручных dict comprehensions.
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    is_admin: bool
+    interests: Optional[str]
+    created_at: datetime
+
+
+class ChannelOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    title: Optional[str]
+    last_post_id: int
+    is_active: bool
+    created_at: datetime
+    last_checked_at: Optional[datetime]
+
+
+class UserBrief(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    telegram_id: int
+    username: Optional[str]
+
+
+class ChannelBrief(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    title: Optional[str]
+
+
+class SubscriptionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    user_id: int
+    channel_id: int
+    created_at: datetime
+    user: Optional[UserBrief]
+    channel: Optional[ChannelBrief]
+
+
+_USERS_ADAPTER = TypeAdapter(list[UserOut])
+_CHANNELS_ADAPTER = TypeAdapter(list[ChannelOut])
+_SUBSCRIPTIONS_ADAPTER = TypeAdapter(list[SubscriptionOut])
+
+
+def _dump_rows(adapter: TypeAdapter, rows) -> list[dict]:
+    """Сериализует список ORM-объектов через pydantic-core"""
+    return adapter.dump_python(adapter.validate_python(rows, from_attributes=True))
+
+
 class ChannelUpdate(BaseModel):
     is_active: bool | None = None
 
@@ -61,80 +199,80 @@ class AIStatusResponse(BaseModel):
 
 
 # Dependency
+# Фабрика сессий инициализируется один раз при первом запросе
+# (лениво, т.к. DATABASE_URL может быть не задан на этапе импорта)
+_session_factory = None
+
+
 async def get_db():
-    async with get_async_session()() as session:
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = get_async_session()
+    async with _session_factory() as session:
         yield session
 
 
+async def get_userbot() -> UserbotService:
+    """Dependency: singleton userbot сервис"""
+    return get_userbot_service()
+
+
 @router.get("/stats", response_model=StatsResponse)
 async def get_stats(db: AsyncSession = Depends(get_db)):
     """Get dashboard statistics"""
-    users = await db.execute(select(func.count(User.id)))
-    channels = await db.execute(select(func.count(Channel.id)))
-    subscriptions = await db.execute(select(func.count(Subscription.id)))
-    posts = await db.execute(select(func.count(Post.id)))
-
-    return StatsResponse(
-        total_users=users.scalar() or 0,
-        total_channels=channels.scalar() or 0,
-        total_subscriptions=subscriptions.scalar() or 0,
-        total_posts=posts.scalar() or 0,
+    cached = _cache_get("stats", ttl=60)
+    if cached is not None:
+        return cached
+
+    # Один запрос вместо четырёх: все счётчики как scalar subqueries
+    result = await db.execute(_STMT_STATS)
+    users, channels, subscriptions, posts = result.one()
+
+    response = StatsResponse(
+        total_users=users or 0,
+        total_channels=channels or 0,
+        total_subscriptions=subscriptions or 0,
+        total_posts=posts or 0,
     )
+    _cache_set("stats", response)
+    return response
 
 
 @router.get("/users")
-async def get_users(db: AsyncSession = Depends(get_db)):
-    """Get all users"""
-    result = await db.execute(
-        select(User).order_by(User.created_at.desc())
-    )
+async def get_users(limit: int = 100, offset: int = 0, db: AsyncSession = Depends(get_db)):
+    """Get users (paginated)"""
+    result = await db.execute(_STMT_USERS.limit(limit).offset(offset))
     users = result.scalars().all()
-    return [
-        {
-            "id": u.id,
-            "telegram_id": u.telegram_id,
-            "username": u.username,
-            "first_name": u.first_name,
-            "is_admin": u.is_admin,
-            "interests": u.interests,
-            "created_at": u.created_at.isoformat(),
-        }
-        for u in users
-    ]
+    return _dump_rows(_USERS_ADAPTER, users)
 
 
 @router.delete("/users/{user_id}")
 async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a user"""
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-    if not user:
+    # Один DELETE вместо SELECT + delete(obj); подписки каскадно
+    # удаляет сам Postgres (ondelete="CASCADE")
+    result = await db.execute(delete(User).where(User.id == user_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="User not found")
 
-    await db.delete(user)
     await db.commit()
+    _cache_invalidate("stats")
     return {"status": "deleted"}
 
 
 @router.get("/channels")
-async def get_channels(db: AsyncSession = Depends(get_db)):
-    """Get all channels"""
-    result = await db.execute(
-        select(Channel).order_by(Channel.created_at.desc())
-    )
+async def get_channels(limit: int = 100, offset: int = 0, db: AsyncSession = Depends(get_db)):
+    """Get channels (paginated)"""
+    cache_key = f"channels:{offset}:{limit}"
+    cached = _cache_get(cache_key, ttl=60)
+    if cached is not None:
+        return cached
+
+    result = await db.execute(_STMT_CHANNELS.limit(limit).offset(offset))
     channels = result.scalars().all()
-    return [
-        {
-            "id": c.id,
-            "username": c.username,
-            "title": c.title,
-            "last_post_id": c.last_post_id,
-            "is_active": c.is_active,
-            "created_at": c.created_at.isoformat(),
-            "last_checked_at": c.last_checked_at.isoformat() if c.last_checked_at else None,
-        }
-        for c in channels
-    ]
+    response = _dump_rows(_CHANNELS_ADAPTER, channels)
+    _cache_set(cache_key, response)
+    return response
 
 
 @router.patch("/channels/{channel_id}")
@@ -144,86 +282,85 @@ async def update_channel(
     db: AsyncSession = Depends(get_db),
 ):
     """Update channel (toggle active status)"""
-    result = await db.execute(select(Channel).where(Channel.id == channel_id))
-    channel = result.scalar_one_or_none()
-    if not channel:
-        raise HTTPException(status_code=404, detail="Channel not found")
-
-    if data.is_active is not None:
-        channel.is_active = data.is_active
+    # UPDATE ... RETURNING: существование и изменение в одном round-trip
+    values = data.model_dump(exclude_unset=True, exclude_none=True)
+    if values:
+        result = await db.execute(
+            update(Channel)
+            .where(Channel.id == channel_id)
+            .values(**values)
+            .returning(Channel.id)
+        )
+        if result.first() is None:
+            raise HTTPException(status_code=404, detail="Channel not found")
+    else:
+        result = await db.execute(
+            select(Channel.id).where(Channel.id == channel_id).limit(1)
+        )
+        if result.first() is None:
+            raise HTTPException(status_code=404, detail="Channel not found")
 
     await db.commit()
+    _cache_invalidate("channels")
     return {"status": "updated"}
 
 
 @router.delete("/channels/{channel_id}")
 async def delete_channel(channel_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a channel"""
-    result = await db.execute(select(Channel).where(Channel.id == channel_id))
-    channel = result.scalar_one_or_none()
-    if not channel:
+    result = await db.execute(delete(Channel).where(Channel.id == channel_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Channel not found")
 
-    await db.delete(channel)
     await db.commit()
+    _cache_invalidate("channels", "stats")
     return {"status": "deleted"}
 
 
 @router.get("/subscriptions")
-async def get_subscriptions(db: AsyncSession = Depends(get_db)):
-    """Get all subscriptions with user and channel info"""
-    result = await db.execute(
-        select(Subscription)
-        .options(selectinload(Subscription.user), selectinload(Subscription.channel))
-        .order_by(Subscription.created_at.desc())
-    )
+async def get_subscriptions(limit: int = 100, offset: int = 0, db: AsyncSession = Depends(get_db)):
+    """Get subscriptions with user and channel info (paginated)"""
+    result = await db.execute(_STMT_SUBSCRIPTIONS.limit(limit).offset(offset))
     subscriptions = result.scalars().all()
-    return [
-        {
-            "id": s.id,
-            "user_id": s.user_id,
-            "channel_id": s.channel_id,
-            "created_at": s.created_at.isoformat(),
-            "user": {
-                "id": s.user.id,
-                "telegram_id": s.user.telegram_id,
-                "username": s.user.username,
-            } if s.user else None,
-            "channel": {
-                "id": s.channel.id,
-                "username": s.channel.username,
-                "title": s.channel.title,
-            } if s.channel else None,
-        }
-        for s in subscriptions
-    ]
+    return _dump_rows(_SUBSCRIPTIONS_ADAPTER, subscriptions)
 
 
 @router.get("/posts")
-async def get_posts(limit: int = 50, db: AsyncSession = Depends(get_db)):
-    """Get recent posts with summaries"""
-    result = await db.execute(
-        select(Post)
-        .options(selectinload(Post.channel))
-        .order_by(Post.created_at.desc())
-        .limit(limit)
-    )
-    posts = result.scalars().all()
+async def get_posts(
+    limit: int = 50,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Get recent posts with summaries.
+
+    Для следующей страницы передать created_at и id последнего
+    полученного поста как before_created_at / before_id (keyset-курсор).
+    """
+    stmt = _STMT_POSTS
+    if before_created_at is not None and before_id is not None:
+        stmt = stmt.where(
+            tuple_(Post.created_at, Post.id) < (before_created_at, before_id)
+        )
+    result = await db.execute(stmt.limit(limit))
+    rows = result.mappings().all()
     return [
         {
-            "id": p.id,
-            "channel_id": p.channel_id,
-            "post_id": p.post_id,
-            "content": p.content[:500] + "..." if p.content and len(p.content) > 500 else p.content,
-            "summary": p.summary,
-            "created_at": p.created_at.isoformat(),
+            "id": r["id"],
+            "channel_id": r["channel_id"],
+            "post_id": r["post_id"],
+            # В БД запрошен 501 символ: если пришло больше 500 — ставим троеточие
+            "content": r["content"][:500] + "..." if r["content"] and len(r["content"]) > 500 else r["content"],
+            "summary": r["summary"],
+            "created_at": r["created_at"],
             "channel": {
-                "id": p.channel.id,
-                "username": p.channel.username,
-                "title": p.channel.title,
-            } if p.channel else None,
+                "id": r["channel_id"],
+                "username": r["channel_username"],
+                "title": r["channel_title"],
+            } if r["channel_username"] else None,
         }
-        for p in posts
+        for r in rows
     ]
 
 
@@ -232,7 +369,7 @@ async def get_posts(limit: int = 50, db: AsyncSession = Depends(get_db)):
 # =============================================================================
 
 @router.get("/userbot/status")
-async def get_userbot_status():
+async def get_userbot_status(userbot: UserbotService = Depends(get_userbot)):
     """
     Получить статус userbot.
 
@@ -242,12 +379,11 @@ async def get_userbot_status():
     - phone: номер телефона (если авторизован)
     - message: описание текущего состояния
     """
-    userbot = get_userbot_service()
     return await userbot.get_status()
 
 
 @router.post("/userbot/start")
-async def start_userbot_auth(data: UserbotPhoneRequest):
+async def start_userbot_auth(data: UserbotPhoneRequest, userbot: UserbotService = Depends(get_userbot)):
     """
     Начать авторизацию userbot.
 
@@ -256,7 +392,6 @@ async def start_userbot_auth(data: UserbotPhoneRequest):
     Args:
         phone_number: Номер в международном формате (+7...)
     """
-    userbot = get_userbot_service()
     result = await userbot.start_auth(data.phone_number)
 
     if not result["success"]:
@@ -266,14 +401,13 @@ async def start_userbot_auth(data: UserbotPhoneRequest):
 
 
 @router.post("/userbot/code")
-async def confirm_userbot_code(data: UserbotCodeRequest):
+async def confirm_userbot_code(data: UserbotCodeRequest, userbot: UserbotService = Depends(get_userbot)):
     """
     Подтвердить код из Telegram.
 
     Args:
         code: 5-значный код из SMS или Telegram
     """
-    userbot = get_userbot_service()
     result = await userbot.confirm_code(data.code)
 
     if not result["success"]:
@@ -283,14 +417,13 @@ async def confirm_userbot_code(data: UserbotCodeRequest):
 
 
 @router.post("/userbot/password")
-async def confirm_userbot_password(data: UserbotPasswordRequest):
+async def confirm_userbot_password(data: UserbotPasswordRequest, userbot: UserbotService = Depends(get_userbot)):
     """
     Подтвердить пароль 2FA.
 
     Args:
         password: Пароль двухфакторной аутентификации
     """
-    userbot = get_userbot_service()
     result = await userbot.confirm_password(data.password)
 
     if not result["success"]:
@@ -300,9 +433,8 @@ async def confirm_userbot_password(data: UserbotPasswordRequest):
 
 
 @router.post("/userbot/logout")
-async def logout_userbot():
+async def logout_userbot(userbot: UserbotService = Depends(get_userbot)):
     """Выйти из аккаунта userbot"""
-    userbot = get_userbot_service()
     result = await userbot.logout()
 
     if not result["success"]:
@@ -312,7 +444,7 @@ async def logout_userbot():
 
 
 @router.post("/userbot/join")
-async def userbot_join_channel(data: UserbotJoinChannelRequest):
+async def userbot_join_channel(data: UserbotJoinChannelRequest, userbot: UserbotService = Depends(get_userbot)):
     """
     Подписать userbot на канал.
 
@@ -321,7 +453,6 @@ async def userbot_join_channel(data: UserbotJoinChannelRequest):
     Args:
         username: Username канала (без @)
     """
-    userbot = get_userbot_service()
     result = await userbot.join_channel(data.username)
 
     if not result["success"]:
@@ -335,6 +466,7 @@ async def get_channel_messages_via_userbot(
     username: str,
     after_id: int = 0,
     limit: int = 10,
+    userbot: UserbotService = Depends(get_userbot),
 ):
     """
     Получить сообщения из канала через userbot.
@@ -346,7 +478,6 @@ async def get_channel_messages_via_userbot(
         after_id: Получать сообщения после этого ID
         limit: Максимальное количество сообщений
     """
-    userbot = get_userbot_service()
     messages = await userbot.get_channel_messages(username, after_id, limit)
 
     return {
@@ -362,9 +493,69 @@ async def get_channel_messages_via_userbot(
 
 GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
 
+# Ленивая инициализация HTTP клиента (общий для всех AI эндпоинтов)
+_http_client: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=15)
+    return _http_client
 
-def _probe_gemini_model(api_key: str, model: str) -> dict:
-    """Проверяет доступность модели Gemini"""
+
+# Single-flight для probe: при параллельных опросах /ai/status
+# к Google уходит ровно один запрос, остальные ждут его результат
+_probe_lock = asyncio.Lock()
+
+# Single-flight по ключу: N одинаковых исходящих запросов к Gemini
+# схлопываются в один, остальные ждут его Task
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def _inflight_done(key: str, task: asyncio.Task) -> None:
+    """Убирает завершённый запрос из реестра single-flight"""
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        # Если никто не ждал — не засоряем лог "exception never retrieved"
+        task.exception()
+
+
+async def _single_flight(key: str, coro_factory):
+    """Выполняет coro_factory() один раз на все параллельные вызовы с ключом"""
+    existing = _inflight.get(key)
+    if existing is not None:
+        return await asyncio.shield(existing)
+
+    # Task, а не Future: переживает отмену запустившего его запроса
+    # (дашборд оборвал свой fetch) и довозит результат остальным
+    # ожидающим — как single-flight в ChannelParser.get_posts
+    task = asyncio.ensure_future(coro_factory())
+    _inflight[key] = task
+    task.add_done_callback(lambda t, key=key: _inflight_done(key, t))
+    return await asyncio.shield(task)
+
+
+async def _probe_gemini_model(api_key: str, model: str) -> dict:
+    """Проверяет доступность модели Gemini (результат кешируется на 30с)"""
+    cache_key = f"ai_probe:{model}"
+    cached = _cache_get(cache_key, ttl=30)
+    if cached is not None:
+        return cached
+
+    async with _probe_lock:
+        # Пока ждали лок, другой запрос мог уже обновить кеш
+        cached = _cache_get(cache_key, ttl=30)
+        if cached is not None:
+            return cached
+
+        result = await _do_probe_gemini_model(api_key, model)
+        _cache_set(cache_key, result)
+        return result
+
+
+async def _do_probe_gemini_model(api_key: str, model: str) -> dict:
+    """Делает реальный probe запрос к Gemini"""
     url = f"{GEMINI_BASE_URL}/models/{model}:generateContent?key={api_key}"
 
     payload = {
@@ -373,20 +564,13 @@ def _probe_gemini_model(api_key: str, model: str) -> dict:
     }
 
     try:
-        req = Request(
-            url,
-            data=json.dumps(payload).encode(),
-            headers={"Content-Type": "application/json"},
-            method="POST"
-        )
-        with urlopen(req, timeout=15) as resp:
+        resp = await _get_http_client().post(url, json=payload)
+        if resp.status_code == 200:
             return {"status": "ok"}
-    except HTTPError as e:
-        if e.code == 429:
+        elif resp.status_code == 429:
             return {"status": "rate_limited", "message": "Лимит исчерпан"}
         else:
-            error_body = e.read().decode()
-            return {"status": "error", "message": f"Error {e.code}"}
+            return {"status": "error", "message": f"Error {resp.status_code}"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -440,7 +624,7 @@ async def get_ai_status():
                 message="GEMINI_API_KEY не настроен"
             )
 
-        result = _probe_gemini_model(api_key, model)
+        result = await _probe_gemini_model(api_key, model)
 
         return AIStatusResponse(
             provider=provider,
@@ -463,30 +647,43 @@ async def get_available_models():
     """
     Получить список доступных моделей Gemini.
     """
+    cached = _cache_get("ai_models", ttl=3600)
+    if cached is not None:
+        return cached
+
     api_key = os.getenv("GEMINI_API_KEY", "")
 
     if not api_key:
         raise HTTPException(status_code=400, detail="GEMINI_API_KEY не настроен")
 
     try:
-        url = f"{GEMINI_BASE_URL}/models?key={api_key}"
-        req = Request(url)
-        with urlopen(req, timeout=15) as resp:
-            data = json.load(resp)
-
-        models = []
-        for m in data.get("models", []):
-            if "generateContent" in m.get("supportedGenerationMethods", []):
-                models.append({
-                    "name": m.get("name", "").replace("models/", ""),
-                    "displayName": m.get("displayName", ""),
-                    "inputTokenLimit": m.get("inputTokenLimit"),
-                    "outputTokenLimit": m.get("outputTokenLimit"),
-                })
-
-        return {
-            "models": models,
-            "count": len(models)
-        }
+        response = await _single_flight(
+            "ai_models", lambda: _fetch_gemini_models(api_key)
+        )
+        _cache_set("ai_models", response)
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _fetch_gemini_models(api_key: str) -> dict:
+    """Запрашивает список моделей у Google"""
+    url = f"{GEMINI_BASE_URL}/models?key={api_key}"
+    resp = await _get_http_client().get(url)
+    resp.raise_for_status()
+    data = resp.json()
+
+    models = []
+    for m in data.get("models", []):
+        if "generateContent" in m.get("supportedGenerationMethods", []):
+            models.append({
+                "name": m.get("name", "").replace("models/", ""),
+                "displayName": m.get("displayName", ""),
+                "inputTokenLimit": m.get("inputTokenLimit"),
+                "outputTokenLimit": m.get("outputTokenLimit"),
+            })
+
+    return {
+        "models": models,
+        "count": len(models)
+    }
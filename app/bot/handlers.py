@@ -1,16 +1,19 @@
+import asyncio
 import logging
 import tempfile
+import time
 import os
 from aiogram import Bot, Dispatcher, Router, types
 from aiogram.filters import CommandStart, Command
 from aiogram.enums import ParseMode
-from sqlalchemy import select, func
+from sqlalchemy import select, func, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.db.database import get_async_session
 from app.db.models import User, Channel, Subscription
-from app.services.parser import ChannelParser
-from app.services.summarizer import Summarizer
-from app.services.transcription import TranscriptionService
+from app.services.parser import get_channel_parser
+from app.services.summarizer import get_summarizer
+from app.services.transcription import get_transcription_service
 from app.services.userbot import get_userbot_service, AuthState
 
 import telegramify_markdown
@@ -18,34 +21,19 @@ from telegramify_markdown import customize
 
 customize.strict_markdown = False
 
+# Локальная ссылка на конвертер: один lookup при импорте вместо
+# двух атрибутных на каждое сообщение
+_md = telegramify_markdown.markdownify
+
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Ленивая инициализация сервисов
-_parser = None
-_summarizer = None
-_transcriber = None
-
-
-def get_parser():
-    global _parser
-    if _parser is None:
-        _parser = ChannelParser()
-    return _parser
-
-
-def get_summarizer():
-    global _summarizer
-    if _summarizer is None:
-        _summarizer = Summarizer()
-    return _summarizer
+# Общие синглтоны сервисов (пулы соединений и клиенты — одни на процесс)
+get_parser = get_channel_parser
 
 
 def get_transcriber():
-    global _transcriber
-    if _transcriber is None:
-        _transcriber = TranscriptionService()
-    return _transcriber
+    return get_transcription_service()
 
 
 def setup_handlers(dp: Dispatcher):
@@ -53,38 +41,103 @@ def setup_handlers(dp: Dispatcher):
     dp.include_router(router)
 
 
+# Backpressure для внешних сервисов: всплеск форвардов не должен
+# упираться в rate limit провайдеров и плодить ретраи
+_PARSER_SEM = asyncio.Semaphore(16)
+_SUMMARIZER_SEM = asyncio.Semaphore(8)
+_TRANSCRIBER_SEM = asyncio.Semaphore(4)
+
+
+async def _limited(sem: asyncio.Semaphore, coro):
+    """Выполняет корутину под семафором (для gather-пачек)"""
+    async with sem:
+        return await coro
+
+
+# Фоновые fire-and-forget задачи (send_chat_action): держим ссылки,
+# чтобы event loop не собрал их до завершения
+_bg_tasks: set[asyncio.Task] = set()
+
+
+def _fire_and_forget(coro) -> None:
+    """Запускает корутину в фоне, удерживая ссылку на задачу"""
+    task = asyncio.create_task(coro)
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
+
+
+# Кеш telegram_id -> user.id: активные пользователи шлют команды
+# пачками, незачем каждый раз ходить в БД за одним и тем же id
+_USER_ID_TTL = 300.0
+_user_id_cache: dict[int, tuple[int, float]] = {}
+
+# Статус userbot меняется только при авторизации/logout — достаточно
+# проверять раз в 30 секунд, а не на каждый форвард
+_USERBOT_STATE_TTL = 30.0
+_userbot_state_cache: tuple[bool, float] = (False, 0.0)
+
+
+async def _userbot_is_authorized() -> bool:
+    """Авторизован ли userbot (результат кешируется на 30 секунд)"""
+    global _userbot_state_cache
+    available, checked_at = _userbot_state_cache
+    if time.monotonic() - checked_at < _USERBOT_STATE_TTL:
+        return available
+
+    available = False
+    try:
+        status = await get_userbot_service().get_status()
+        available = status.get("state") == AuthState.AUTHORIZED
+    except Exception:
+        pass
+
+    _userbot_state_cache = (available, time.monotonic())
+    return available
+
+
+async def resolve_user_id(session, telegram_id: int) -> int | None:
+    """Возвращает user.id по telegram_id (с TTL-кешем в памяти)"""
+    cached = _user_id_cache.get(telegram_id)
+    if cached and time.monotonic() - cached[1] < _USER_ID_TTL:
+        return cached[0]
+
+    result = await session.execute(
+        select(User.id).where(User.telegram_id == telegram_id)
+    )
+    user_id = result.scalar_one_or_none()
+    if user_id is not None:
+        _user_id_cache[telegram_id] = (user_id, time.monotonic())
+    return user_id
+
+
 async def get_or_create_user(telegram_id: int, username: str | None, first_name: str | None) -> User:
-    """Получает или создаёт пользователя"""
+    """Получает или создаёт пользователя (upsert одним запросом)"""
     async with get_async_session()() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-
-        if not user:
-            user = User(
+        # INSERT ... ON CONFLICT DO UPDATE ... RETURNING: один round-trip
+        # без гонки между SELECT и INSERT, заодно освежает username
+        stmt = (
+            pg_insert(User)
+            .values(
                 telegram_id=telegram_id,
                 username=username,
                 first_name=first_name,
             )
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
-            logger.info(f"Created new user: {telegram_id}")
+            .on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={"username": username, "first_name": first_name},
+            )
+            .returning(User)
+        )
+        result = await session.execute(stmt)
+        user = result.scalar_one()
+        await session.commit()
 
         return user
 
 
-@router.message(CommandStart())
-async def cmd_start(message: types.Message):
-    """Обработчик /start"""
-    await get_or_create_user(
-        message.from_user.id,
-        message.from_user.username,
-        message.from_user.first_name,
-    )
-
-    text = """**Привет! Я бот для создания резюме постов из Telegram-каналов.**
+# Тексты /start и /help статичные — форматируем один раз при импорте,
+# а не прогоняем markdownify на каждое сообщение
+_START_TEXT_MD = _md("""**Привет! Я бот для создания резюме постов из Telegram-каналов.**
 
 **Как пользоваться:**
 1. Перешли мне сообщение из публичного канала
@@ -98,16 +151,9 @@ async def cmd_start(message: types.Message):
 
 **Пример интересов:**
 `/interests криптовалюты, AI, стартапы`
-→ посты на эти темы будут выделены 🔥🔥🔥"""
-
-    formatted = telegramify_markdown.markdownify(text)
-    await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
+→ посты на эти темы будут выделены 🔥🔥🔥""")
 
-
-@router.message(Command("help"))
-async def cmd_help(message: types.Message):
-    """Обработчик /help"""
-    text = """**Справка по боту**
+_HELP_TEXT_MD = _md("""**Справка по боту**
 
 **Добавление канала:**
 Перешли любое сообщение из публичного канала, и он автоматически добавится в твой дайджест.
@@ -125,36 +171,45 @@ async def cmd_help(message: types.Message):
 Пример: `/interests криптовалюты, AI, стартапы`
 
 **Как это работает:**
-Бот проверяет каналы каждые 5 минут. Когда появляется новый пост, создаётся краткое резюме с помощью AI и отправляется тебе."""
+Бот проверяет каналы каждые 5 минут. Когда появляется новый пост, создаётся краткое резюме с помощью AI и отправляется тебе.""")
 
-    formatted = telegramify_markdown.markdownify(text)
-    await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
+
+@router.message(CommandStart())
+async def cmd_start(message: types.Message):
+    """Обработчик /start"""
+    await get_or_create_user(
+        message.from_user.id,
+        message.from_user.username,
+        message.from_user.first_name,
+    )
+
+    await message.answer(_START_TEXT_MD, parse_mode=ParseMode.MARKDOWN_V2)
+
+
+@router.message(Command("help"))
+async def cmd_help(message: types.Message):
+    """Обработчик /help"""
+    await message.answer(_HELP_TEXT_MD, parse_mode=ParseMode.MARKDOWN_V2)
 
 
 @router.message(Command("channels"))
 async def cmd_channels(message: types.Message):
     """Показывает список каналов пользователя"""
     async with get_async_session()() as session:
+        # Каналы пользователя одним запросом через JOIN по подпискам
         result = await session.execute(
-            select(Subscription)
-            .join(User)
-            .join(Channel)
+            select(Channel)
+            .join(Subscription, Subscription.channel_id == Channel.id)
+            .join(User, User.id == Subscription.user_id)
             .where(User.telegram_id == message.from_user.id)
-            .options()
+            .order_by(Channel.username)
         )
-        subscriptions = result.scalars().all()
+        channels = result.scalars().all()
 
-        if not subscriptions:
+        if not channels:
             await message.answer("У тебя пока нет подписок на каналы.\n\nПерешли сообщение из любого канала, чтобы добавить его.")
             return
 
-        # Получаем каналы
-        channel_ids = [s.channel_id for s in subscriptions]
-        channels_result = await session.execute(
-            select(Channel).where(Channel.id.in_(channel_ids))
-        )
-        channels = channels_result.scalars().all()
-
         text = "**Твои каналы:**\n\n"
         for ch in channels:
             status = "✅" if ch.is_active else "❌"
@@ -165,7 +220,7 @@ async def cmd_channels(message: types.Message):
 
         text += f"\n_Всего: {len(channels)} каналов_"
 
-        formatted = telegramify_markdown.markdownify(text)
+        formatted = _md(text)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
 
@@ -195,6 +250,30 @@ async def cmd_add(message: types.Message):
     already_exists = []
     failed = []
 
+    # Сетевые проверки для всех каналов параллельно: доступность и
+    # последние посты. Последовательно это 2N round-trip'ов к t.me.
+    parser = get_parser()
+    public_flags, posts_lists = await asyncio.gather(
+        asyncio.gather(
+            *[_limited(_PARSER_SEM, parser.is_channel_public(u)) for u in channels_to_add],
+            return_exceptions=True,
+        ),
+        asyncio.gather(
+            *[_limited(_PARSER_SEM, parser.get_posts(u, 0)) for u in channels_to_add],
+            return_exceptions=True,
+        ),
+    )
+    is_public_map = {
+        u: flag is True for u, flag in zip(channels_to_add, public_flags)
+    }
+    latest_post_ids = {}
+    for u, posts in zip(channels_to_add, posts_lists):
+        if isinstance(posts, Exception):
+            logger.warning(f"Could not get latest post for @{u}: {posts}")
+            latest_post_ids[u] = 0
+        else:
+            latest_post_ids[u] = max((p.post_id for p in posts), default=0)
+
     async with get_async_session()() as session:
         # Получаем или создаём пользователя
         user_result = await session.execute(
@@ -211,31 +290,55 @@ async def cmd_add(message: types.Message):
             session.add(user)
             await session.flush()
 
+        # Существующие каналы и подписки одним IN-запросом каждая —
+        # вместо 2N одиночных SELECT внутри цикла
+        channels_result = await session.execute(
+            select(Channel).where(Channel.username.in_(channels_to_add))
+        )
+        existing_channels = {c.username: c for c in channels_result.scalars()}
+
+        existing_sub_channel_ids: set[int] = set()
+        if existing_channels:
+            subs_result = await session.execute(
+                select(Subscription.channel_id).where(
+                    Subscription.user_id == user.id,
+                    Subscription.channel_id.in_(
+                        [c.id for c in existing_channels.values()]
+                    ),
+                )
+            )
+            existing_sub_channel_ids = set(subs_result.scalars().all())
+
+        # Инфо о каналах нужно только для тех, которых ещё нет в БД —
+        # забираем параллельно
+        missing = [
+            u for u in channels_to_add
+            if u not in existing_channels and is_public_map.get(u)
+        ]
+        infos = await asyncio.gather(
+            *[_limited(_PARSER_SEM, parser.get_channel_info(u)) for u in missing],
+            return_exceptions=True,
+        )
+        info_map = {
+            u: info for u, info in zip(missing, infos)
+            if not isinstance(info, Exception)
+        }
+
+        sub_rows: list[dict] = []
+        username_by_channel_id: dict[int, str] = {}
+
         for channel_username in channels_to_add:
             try:
-                # Проверяем доступность канала
-                is_public = await get_parser().is_channel_public(channel_username)
-                if not is_public:
+                # Проверяем доступность канала (предзагружено выше)
+                if not is_public_map.get(channel_username):
                     failed.append(f"@{channel_username} (недоступен)")
                     continue
 
-                # Получаем или создаём канал
-                channel_result = await session.execute(
-                    select(Channel).where(Channel.username == channel_username)
-                )
-                channel = channel_result.scalar_one_or_none()
-
-                # Получаем ID последнего поста
-                latest_post_id = 0
-                try:
-                    posts = await get_parser().get_posts(channel_username, 0)
-                    if posts:
-                        latest_post_id = max(p.post_id for p in posts)
-                except Exception as e:
-                    logger.warning(f"Could not get latest post for @{channel_username}: {e}")
+                channel = existing_channels.get(channel_username)
+                latest_post_id = latest_post_ids.get(channel_username, 0)
 
                 if not channel:
-                    info = await get_parser().get_channel_info(channel_username)
+                    info = info_map.get(channel_username)
                     channel = Channel(
                         username=channel_username,
                         title=info.title if info else channel_username,
@@ -250,26 +353,34 @@ async def cmd_add(message: types.Message):
                         channel.last_post_id = latest_post_id
                         logger.info(f"Updated @{channel_username} last_post_id={latest_post_id}")
 
-                # Проверяем подписку
-                sub_result = await session.execute(
-                    select(Subscription).where(
-                        Subscription.user_id == user.id,
-                        Subscription.channel_id == channel.id
-                    )
-                )
-                if sub_result.scalar_one_or_none():
+                # Проверяем подписку (предзагружено выше)
+                if channel.id in existing_sub_channel_ids:
                     already_exists.append(f"@{channel_username}")
                     continue
 
-                # Создаём подписку
-                subscription = Subscription(user_id=user.id, channel_id=channel.id)
-                session.add(subscription)
-                added.append(f"@{channel_username}")
+                sub_rows.append({"user_id": user.id, "channel_id": channel.id})
+                username_by_channel_id[channel.id] = channel_username
 
             except Exception as e:
                 logger.error(f"Error adding channel @{channel_username}: {e}")
                 failed.append(f"@{channel_username} (ошибка)")
 
+        # Все подписки одним multi-row INSERT; ON CONFLICT страхует от
+        # гонки с параллельным /add, RETURNING говорит что реально вставилось
+        if sub_rows:
+            insert_result = await session.execute(
+                pg_insert(Subscription)
+                .values(sub_rows)
+                .on_conflict_do_nothing(index_elements=["user_id", "channel_id"])
+                .returning(Subscription.channel_id)
+            )
+            inserted_ids = set(insert_result.scalars().all())
+            for channel_id, channel_username in username_by_channel_id.items():
+                if channel_id in inserted_ids:
+                    added.append(f"@{channel_username}")
+                else:
+                    already_exists.append(f"@{channel_username}")
+
         await session.commit()
 
     # Формируем ответ
@@ -295,32 +406,24 @@ async def cmd_remove(message: types.Message):
     arg = args[1].strip().lower()
 
     async with get_async_session()() as session:
-        # Находим пользователя
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = user_result.scalar_one_or_none()
-        if not user:
+        # Находим пользователя (id из кеша, если недавно обращался)
+        user_id = await resolve_user_id(session, message.from_user.id)
+        if user_id is None:
             await message.answer("Ошибка: пользователь не найден")
             return
 
-        # Удаление всех подписок
+        # Удаление всех подписок одним DELETE
         if arg == "all":
-            sub_result = await session.execute(
-                select(Subscription).where(Subscription.user_id == user.id)
+            result = await session.execute(
+                delete(Subscription).where(Subscription.user_id == user_id)
             )
-            subscriptions = sub_result.scalars().all()
+            await session.commit()
 
-            if not subscriptions:
+            if result.rowcount == 0:
                 await message.answer("У тебя нет подписок")
                 return
 
-            count = len(subscriptions)
-            for sub in subscriptions:
-                await session.delete(sub)
-            await session.commit()
-
-            await message.answer(f"✅ Удалено {count} подписок")
+            await message.answer(f"✅ Удалено {result.rowcount} подписок")
             return
 
         # Удаление одной подписки
@@ -335,22 +438,19 @@ async def cmd_remove(message: types.Message):
             await message.answer(f"Канал @{channel_username} не найден")
             return
 
-        # Удаляем подписку
-        sub_result = await session.execute(
-            select(Subscription).where(
-                Subscription.user_id == user.id,
+        # Удаляем подписку одним DELETE; rowcount говорит, была ли она
+        result = await session.execute(
+            delete(Subscription).where(
+                Subscription.user_id == user_id,
                 Subscription.channel_id == channel.id
             )
         )
-        subscription = sub_result.scalar_one_or_none()
+        await session.commit()
 
-        if not subscription:
+        if result.rowcount == 0:
             await message.answer(f"Ты не подписан на @{channel_username}")
             return
 
-        await session.delete(subscription)
-        await session.commit()
-
         await message.answer(f"✅ Отписался от @{channel_username}")
 
 
@@ -364,47 +464,63 @@ async def cmd_refresh(message: types.Message):
         await message.answer("❌ Scheduler не запущен")
         return
 
-    await message.answer("🔄 Запускаю проверку каналов...")
+    # Будим фоновый цикл вместо запуска проверки прямо в хендлере —
+    # без конкурирующего прохода по тем же каналам
+    scheduler.trigger_now()
+    await message.answer("🔄 Проверка каналов запущена")
 
-    try:
-        await scheduler._check_channels()
-        await message.answer("✅ Проверка завершена")
-    except Exception as e:
-        logger.error(f"Refresh error: {e}")
-        await message.answer(f"❌ Ошибка: {e}")
+
+# Глобальные счётчики /stats: COUNT(*) по всей таблице не обязан быть
+# свежее минуты, а сканы растут линейно с базой
+_GLOBAL_COUNTS_TTL = 60.0
+_global_counts = {"users": 0, "channels": 0, "ts": 0.0}
 
 
 @router.message(Command("stats"))
 async def cmd_stats(message: types.Message):
     """Статистика пользователя"""
     async with get_async_session()() as session:
-        # Количество подписок пользователя
-        user_result = await session.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = user_result.scalar_one_or_none()
+        # Количество подписок пользователя (id из кеша)
+        user_id = await resolve_user_id(session, message.from_user.id)
 
-        if not user:
+        if user_id is None:
             await message.answer("Ошибка: пользователь не найден")
             return
 
-        subs_count = await session.execute(
-            select(func.count(Subscription.id)).where(Subscription.user_id == user.id)
-        )
-        subs = subs_count.scalar()
-
-        # Общая статистика
-        total_users = await session.execute(select(func.count(User.id)))
-        total_channels = await session.execute(select(func.count(Channel.id)))
+        if time.monotonic() - _global_counts["ts"] < _GLOBAL_COUNTS_TTL:
+            # Глобальные счётчики из кеша — остаётся один лёгкий
+            # индексный COUNT по подпискам пользователя
+            subs = await session.scalar(
+                select(func.count(Subscription.id))
+                .where(Subscription.user_id == user_id)
+            )
+            total_users = _global_counts["users"]
+            total_channels = _global_counts["channels"]
+        else:
+            # Все три счётчика одним запросом (scalar subqueries) —
+            # один round-trip вместо трёх
+            counts = await session.execute(
+                select(
+                    select(func.count(Subscription.id))
+                    .where(Subscription.user_id == user_id)
+                    .scalar_subquery(),
+                    select(func.count(User.id)).scalar_subquery(),
+                    select(func.count(Channel.id)).scalar_subquery(),
+                )
+            )
+            subs, total_users, total_channels = counts.one()
+            _global_counts.update(
+                users=total_users, channels=total_channels, ts=time.monotonic()
+            )
 
-        text = f"""**Статистика**
+    text = f"""**Статистика**
 
 Твоих подписок: {subs}
-Всего пользователей: {total_users.scalar()}
-Всего каналов: {total_channels.scalar()}"""
+Всего пользователей: {total_users}
+Всего каналов: {total_channels}"""
 
-        formatted = telegramify_markdown.markdownify(text)
-        await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
+    formatted = _md(text)
+    await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
 
 @router.message(Command("interests"))
@@ -445,7 +561,7 @@ async def cmd_interests(message: types.Message):
 **Пример:**
 `/interests криптовалюты, AI, стартапы, инвестиции`"""
 
-            formatted = telegramify_markdown.markdownify(text)
+            formatted = _md(text)
             await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
             return
 
@@ -468,7 +584,7 @@ async def cmd_interests(message: types.Message):
 
 Теперь посты по этим темам будут отмечены 🔥"""
 
-        formatted = telegramify_markdown.markdownify(text)
+        formatted = _md(text)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
         logger.info(f"User {message.from_user.id} set interests: {new_interests[:50]}...")
@@ -515,12 +631,15 @@ async def handle_message(message: types.Message):
         return
 
     # Делаем резюме
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    # UX-хинт, а не зависимость — не ждём round-trip к Telegram,
+    # пайплайн стартует сразу
+    _fire_and_forget(message.bot.send_chat_action(message.chat.id, "typing"))
 
     try:
-        summary, stats = await get_summarizer().summarize(text)
+        async with _SUMMARIZER_SEM:
+            summary, stats = await get_summarizer().summarize(text)
 
-        formatted = telegramify_markdown.markdownify(summary)
+        formatted = _md(summary)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
         logger.info(f"[TOKENS] User: {message.from_user.id} | Stats: {stats}")
@@ -539,7 +658,8 @@ async def handle_forwarded_channel_message(message: types.Message):
         return
 
     # Проверяем, публичный ли канал
-    is_public = await get_parser().is_channel_public(channel_username)
+    async with _PARSER_SEM:
+        is_public = await get_parser().is_channel_public(channel_username)
     if not is_public:
         await message.answer(f"Канал @{channel_username} недоступен (приватный или не существует).")
         return
@@ -568,7 +688,8 @@ async def handle_forwarded_channel_message(message: types.Message):
 
         if not channel:
             # Получаем информацию о канале
-            info = await get_parser().get_channel_info(channel_username)
+            async with _PARSER_SEM:
+                info = await get_parser().get_channel_info(channel_username)
 
             # Используем ID пересланного поста как стартовую точку
             # Чтобы не обрабатывать старые посты
@@ -604,13 +725,7 @@ async def handle_forwarded_channel_message(message: types.Message):
         title = channel.title or channel_username
 
         # Проверяем, авторизован ли userbot (для полного парсинга медиа)
-        userbot_available = False
-        try:
-            userbot = get_userbot_service()
-            status = await userbot.get_status()
-            userbot_available = status.get("state") == AuthState.AUTHORIZED
-        except Exception:
-            pass
+        userbot_available = await _userbot_is_authorized()
 
         # Формируем ответ
         response = f"✅ Канал **@{channel_username}** добавлен в твой дайджест!\n\n"
@@ -627,22 +742,25 @@ async def handle_forwarded_channel_message(message: types.Message):
 async def handle_voice_message(message: types.Message):
     """Обрабатывает голосовое сообщение"""
     logger.info(f"[VOICE] Processing voice from user {message.from_user.id}")
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    # UX-хинт, а не зависимость — не ждём round-trip к Telegram,
+    # пайплайн стартует сразу
+    _fire_and_forget(message.bot.send_chat_action(message.chat.id, "typing"))
 
     try:
         # Скачиваем файл
         logger.info(f"[VOICE] Downloading file {message.voice.file_id}")
         file = await message.bot.get_file(message.voice.file_id)
         file_data = await message.bot.download_file(file.file_path)
-        logger.info(f"[VOICE] Downloaded, size: {len(file_data.getvalue())} bytes")
+        logger.info(f"[VOICE] Downloaded, size: {file_data.getbuffer().nbytes} bytes")
 
         # Транскрибируем
         await message.answer("🎤 Транскрибирую голосовое...")
         logger.info("[VOICE] Starting transcription...")
-        transcript = await get_transcriber().transcribe_bytes(
-            file_data.read(),
-            filename="voice.ogg"
-        )
+        async with _TRANSCRIBER_SEM:
+            transcript = await get_transcriber().transcribe_stream(
+                file_data,
+                filename="voice.ogg"
+            )
         logger.info(f"[VOICE] Transcription done: {len(transcript) if transcript else 0} chars")
 
         if not transcript or len(transcript.strip()) < 10:
@@ -652,13 +770,14 @@ async def handle_voice_message(message: types.Message):
         # Делаем резюме если текст достаточно длинный
         if len(transcript) > 100:
             await message.answer("📝 Создаю резюме...")
-            summary, stats = await get_summarizer().summarize(transcript)
+            async with _SUMMARIZER_SEM:
+                summary, stats = await get_summarizer().summarize(transcript)
 
             response = f"**🎤 Транскрипция:**\n{transcript}\n\n**📝 Резюме:**\n{summary}"
         else:
             response = f"**🎤 Транскрипция:**\n{transcript}"
 
-        formatted = telegramify_markdown.markdownify(response)
+        formatted = _md(response)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
         logger.info(f"Voice transcribed for user {message.from_user.id}: {len(transcript)} chars")
@@ -670,7 +789,9 @@ async def handle_voice_message(message: types.Message):
 
 async def handle_video_note(message: types.Message):
     """Обрабатывает видео-кружок"""
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    # UX-хинт, а не зависимость — не ждём round-trip к Telegram,
+    # пайплайн стартует сразу
+    _fire_and_forget(message.bot.send_chat_action(message.chat.id, "typing"))
 
     try:
         # Скачиваем файл
@@ -679,10 +800,11 @@ async def handle_video_note(message: types.Message):
 
         # Транскрибируем
         await message.answer("🔵 Транскрибирую кружок...")
-        transcript = await get_transcriber().transcribe_bytes(
-            file_data.read(),
-            filename="video_note.mp4"
-        )
+        async with _TRANSCRIBER_SEM:
+            transcript = await get_transcriber().transcribe_stream(
+                file_data,
+                filename="video_note.mp4"
+            )
 
         if not transcript or len(transcript.strip()) < 10:
             await message.answer("Не удалось распознать речь в кружке.")
@@ -691,13 +813,14 @@ async def handle_video_note(message: types.Message):
         # Делаем резюме если текст достаточно длинный
         if len(transcript) > 100:
             await message.answer("📝 Создаю резюме...")
-            summary, stats = await get_summarizer().summarize(transcript)
+            async with _SUMMARIZER_SEM:
+                summary, stats = await get_summarizer().summarize(transcript)
 
             response = f"**🔵 Транскрипция кружка:**\n{transcript}\n\n**📝 Резюме:**\n{summary}"
         else:
             response = f"**🔵 Транскрипция кружка:**\n{transcript}"
 
-        formatted = telegramify_markdown.markdownify(response)
+        formatted = _md(response)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
         logger.info(f"Video note transcribed for user {message.from_user.id}: {len(transcript)} chars")
@@ -709,7 +832,9 @@ async def handle_video_note(message: types.Message):
 
 async def handle_audio_message(message: types.Message):
     """Обрабатывает аудио файл"""
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    # UX-хинт, а не зависимость — не ждём round-trip к Telegram,
+    # пайплайн стартует сразу
+    _fire_and_forget(message.bot.send_chat_action(message.chat.id, "typing"))
 
     try:
         # Скачиваем файл
@@ -721,10 +846,11 @@ async def handle_audio_message(message: types.Message):
 
         # Транскрибируем
         await message.answer("🎵 Транскрибирую аудио...")
-        transcript = await get_transcriber().transcribe_bytes(
-            file_data.read(),
-            filename=filename
-        )
+        async with _TRANSCRIBER_SEM:
+            transcript = await get_transcriber().transcribe_stream(
+                file_data,
+                filename=filename
+            )
 
         if not transcript or len(transcript.strip()) < 10:
             await message.answer("Не удалось распознать речь в аудио.")
@@ -733,13 +859,14 @@ async def handle_audio_message(message: types.Message):
         # Делаем резюме если текст достаточно длинный
         if len(transcript) > 100:
             await message.answer("📝 Создаю резюме...")
-            summary, stats = await get_summarizer().summarize(transcript)
+            async with _SUMMARIZER_SEM:
+                summary, stats = await get_summarizer().summarize(transcript)
 
             response = f"**🎵 Транскрипция аудио:**\n{transcript}\n\n**📝 Резюме:**\n{summary}"
         else:
             response = f"**🎵 Транскрипция аудио:**\n{transcript}"
 
-        formatted = telegramify_markdown.markdownify(response)
+        formatted = _md(response)
         await message.answer(formatted, parse_mode=ParseMode.MARKDOWN_V2)
 
         logger.info(f"Audio transcribed for user {message.from_user.id}: {len(transcript)} chars")
@@ -20,6 +20,9 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = os.getenv("DATABASE_URL", "")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    db_pool_recycle: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
     # Admin
     admin_password: str = os.getenv("ADMIN_PASSWORD", "admin123")
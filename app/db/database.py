@@ -1,10 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 import os
+import threading
 
-# Lazy initialization
+# Lazy initialization (лок — чтобы гонка корутин на старте
+# не создала два пула соединений)
 _engine = None
 _async_session = None
+_init_lock = threading.RLock()
 
 
 def get_database_url() -> str:
@@ -26,11 +29,33 @@ def get_engine():
     """Lazy engine initialization"""
     global _engine
     if _engine is None:
-        _engine = create_async_engine(
-            get_database_url(),
-            echo=False,
-            pool_pre_ping=True,
-        )
+        with _init_lock:
+            if _engine is not None:
+                return _engine
+            from app.config import get_settings
+            settings = get_settings()
+            _engine = create_async_engine(
+                get_database_url(),
+                echo=False,
+                pool_pre_ping=True,
+                # Дефолтных 5 соединений не хватает при всплеске апдейтов
+                # от webhook — хендлеры зависают в ожидании коннекта из пула
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                pool_timeout=10,
+                # Railway-прокси убивает долгоживущие idle-соединения —
+                # обновляем их сами, не дожидаясь реконнекта через pre_ping
+                pool_recycle=settings.db_pool_recycle,
+                query_cache_size=1200,
+                # asyncpg кеширует prepared statements — повторные запросы
+                # не парсятся заново на стороне Postgres
+                connect_args={
+                    "statement_cache_size": 500,
+                    "timeout": 10,
+                    "command_timeout": 30,
+                    "server_settings": {"application_name": "tg-resume-bot", "jit": "off"},
+                },
+            )
     return _engine
 
 
@@ -38,34 +63,43 @@ def get_async_session():
     """Lazy session factory initialization"""
     global _async_session
     if _async_session is None:
-        _async_session = async_sessionmaker(
-            get_engine(),
-            class_=AsyncSession,
-            expire_on_commit=False,
-        )
+        with _init_lock:
+            if _async_session is not None:
+                return _async_session
+            _async_session = async_sessionmaker(
+                get_engine(),
+                class_=AsyncSession,
+                expire_on_commit=False,
+                # Код и так делает flush()/commit() явно — autoflush
+                # только гоняет identity map на каждом execute
+                autoflush=False,
+            )
     return _async_session
 
 
-# Aliases for compatibility
-@property
-def engine():
-    return get_engine()
-
-
-@property
-def async_session():
-    return get_async_session()
-
-
 class Base(DeclarativeBase):
     pass
 
 
 async def init_db():
     """Создаёт все таблицы"""
+    from sqlalchemy import text
     from app.db.models import User, Channel, Subscription, Post  # noqa
     async with get_engine().begin() as conn:
+        # pg_trgm нужен для GIN trigram индексов поиска по постам
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        # create_all создаёт только недостающие таблицы — индексы,
+        # объявленные позже на уже существующих таблицах, он молча
+        # пропускает. Без Alembic досоздаём их здесь идемпотентно
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(sync_conn):
+    """Создаёт индексы из metadata, которых ещё нет в БД"""
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 
 async def get_session() -> AsyncSession:
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db.database import Base
 
@@ -43,6 +43,12 @@ class Channel(Base):
         "Post", back_populates="channel", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # Выборка каналов на проверку фильтрует по is_active
+        # и сортируется по давности проверки
+        Index("ix_channels_active_lastchecked", "is_active", "last_checked_at"),
+    )
+
     def __repr__(self):
         return f"<Channel @{self.username}>"
 
@@ -61,6 +67,9 @@ class Subscription(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "channel_id", name="unique_user_channel"),
+        # unique_user_channel покрывает выборки по user_id, но не по
+        # channel_id — а рассылка ищет подписчиков именно по каналу
+        Index("ix_subscriptions_channel_id", "channel_id"),
     )
 
     def __repr__(self):
@@ -82,6 +91,32 @@ class Post(Base):
 
     __table_args__ = (
         UniqueConstraint("channel_id", "post_id", name="unique_channel_post"),
+        # Покрывающий индекс: проверка существования поста читает
+        # только индекс (index-only scan), без обращения к heap
+        Index(
+            "ix_posts_channel_post",
+            "channel_id",
+            "post_id",
+            postgresql_include=["id"],
+        ),
+        # Keyset-пагинация в /posts: ORDER BY created_at DESC, id DESC
+        # идёт по индексу вместо сортировки всей таблицы
+        Index("ix_posts_created_at_id", created_at.desc(), id.desc()),
+        # Поиск в админке делает ILIKE '%q%' по content/summary —
+        # trigram GIN индексы превращают full scan в index scan
+        # (расширение pg_trgm создаётся в init_db)
+        Index(
+            "ix_posts_content_trgm",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_posts_summary_trgm",
+            "summary",
+            postgresql_using="gin",
+            postgresql_ops={"summary": "gin_trgm_ops"},
+        ),
     )
 
     def __repr__(self):
@@ -114,5 +149,17 @@ class UserbotSession(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     last_used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
+    __table_args__ = (
+        # get_client/get_status/_save_session ищут активную сессию
+        # как WHERE is_active [AND is_authorized] ORDER BY created_at
+        # DESC LIMIT 1 — составной индекс убирает сортировку
+        Index(
+            "ix_userbot_active_auth_created",
+            "is_active",
+            "is_authorized",
+            created_at.desc(),
+        ),
+    )
+
     def __repr__(self):
         return f"<UserbotSession {self.phone_number} authorized={self.is_authorized}>"
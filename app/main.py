@@ -4,13 +4,17 @@ import os
 import sys
 
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.sessions import SessionMiddleware
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import Update, BotCommand
 
+import orjson
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -27,6 +31,10 @@ scheduler = None
 # Webhook path
 WEBHOOK_PATH = "/webhook"
 
+# Фоновые задачи обработки апдейтов: держим ссылки, чтобы
+# event loop не собрал их до завершения
+_update_tasks: set[asyncio.Task] = set()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -47,8 +55,15 @@ async def lifespan(app: FastAPI):
         logger.error("BOT_TOKEN not set!")
         raise ValueError("BOT_TOKEN not set")
 
-    # Инициализация бота
-    bot = Bot(token=BOT_TOKEN)
+    # Инициализация бота (orjson парсит/сериализует ответы Bot API
+    # в разы быстрее stdlib json)
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=AiohttpSession(
+            json_loads=orjson.loads,
+            json_dumps=lambda obj: orjson.dumps(obj).decode(),
+        ),
+    )
     dp = Dispatcher()
 
     # Инициализация БД
@@ -107,6 +122,10 @@ async def lifespan(app: FastAPI):
     if scheduler:
         await scheduler.stop()
 
+    # Закрываем общий httpx-клиент парсера
+    from app.services.parser import get_channel_parser
+    await get_channel_parser().close()
+
     # Удаляем webhook при остановке
     if WEBHOOK_URL:
         await bot.delete_webhook()
@@ -120,6 +139,8 @@ app = FastAPI(
     title="Channel Resume Bot",
     description="Telegram bot for channel digests",
     lifespan=lifespan,
+    # orjson сериализует в разы быстрее stdlib json и нативно понимает datetime
+    default_response_class=ORJSONResponse,
 )
 
 # Middleware
@@ -145,41 +166,49 @@ app.include_router(api_router)
 async def webhook_handler(request: Request):
     """Обработчик webhook от Telegram"""
     try:
-        data = await request.json()
+        # Парсинг + валидация за один проход Rust-парсером pydantic,
+        # без промежуточного json.loads-словаря
+        raw = await request.body()
+        update = Update.model_validate_json(raw)
 
-        # Логируем ВСЕ входящие сообщения
-        logger.info(f"[WEBHOOK] Received update: {data.get('update_id')}")
+        logger.info(f"[WEBHOOK] Received update: {update.update_id}")
 
-        if 'message' in data:
-            msg = data['message']
+        # Подробный разбор сообщения — только на DEBUG
+        if logger.isEnabledFor(logging.DEBUG) and update.message:
+            msg = update.message
             msg_type = "unknown"
-            if msg.get('text'):
+            if msg.text:
                 msg_type = "text"
-            elif msg.get('voice'):
+            elif msg.voice:
                 msg_type = "voice"
-            elif msg.get('video_note'):
+            elif msg.video_note:
                 msg_type = "video_note"
-            elif msg.get('audio'):
+            elif msg.audio:
                 msg_type = "audio"
-            elif msg.get('photo'):
+            elif msg.photo:
                 msg_type = "photo"
-            elif msg.get('forward_from_chat'):
+            elif msg.forward_from_chat:
                 msg_type = "forwarded"
 
-            from_user = msg.get('from', {})
-            logger.info(
+            from_user = msg.from_user
+            logger.debug(
                 f"[WEBHOOK] Message type={msg_type} "
-                f"from={from_user.get('id')} "
-                f"(@{from_user.get('username', 'no_username')})"
+                f"from={from_user.id if from_user else None} "
+                f"(@{from_user.username if from_user else 'no_username'})"
             )
 
-        update = Update(**data)
-        await dp.feed_update(bot, update)
+        # Отвечаем Telegram сразу, апдейт обрабатываем в фоне —
+        # иначе долгий LLM/DB-пайплайн блокирует воркер и Telegram
+        # начинает ретраить webhook
+        task = asyncio.create_task(dp.feed_update(bot, update))
+        _update_tasks.add(task)
+        task.add_done_callback(_update_tasks.discard)
 
     except Exception as e:
         logger.error(f"[WEBHOOK] Error processing update: {e}", exc_info=True)
 
-    return {"ok": True}
+    # Telegram важен только статус 200 — без JSON-сериализации
+    return Response(status_code=200)
 
 
 @app.get("/")
@@ -204,4 +233,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8000)),
         reload=False,
+        # uvloop примерно вдвое быстрее стокового loop'а на мелких задачах
+        loop="uvloop",
     )
@@ -1,13 +1,20 @@
 import httpx
-from bs4 import BeautifulSoup
+from aiolimiter import AsyncLimiter
+from selectolax.lexbor import LexborHTMLParser
 from dataclasses import dataclass
 from datetime import datetime
-import logging
 import asyncio
-import random
+import hashlib
+import logging
+import os
+import re
+import time
 
 logger = logging.getLogger(__name__)
 
+# style="...background-image:url('...')..." — регэксп компилируется один раз
+_BG_RE = re.compile(r"background-image:url\('([^']+)'\)")
+
 
 @dataclass
 class ParsedPost:
@@ -33,144 +40,174 @@ class ChannelParser:
     BASE_URL = "https://t.me/s"
     TIMEOUT = 10.0
 
+    # Публичность канала и его title меняются редко — кешируем,
+    # чтобы повторное добавление популярного канала не ходило в t.me
+    PUBLIC_TTL = 3600.0
+    INFO_TTL = 86400.0
+
     def __init__(self):
+        # Token bucket вместо слепого sleep перед каждым запросом:
+        # всплески проходят сразу, устоявшийся поток держится под лимитом
+        self.limiter = AsyncLimiter(
+            max_rate=float(os.getenv("TME_RPS", "10")), time_period=1.0
+        )
+        self._public_cache: dict[str, tuple[bool, float]] = {}
+        self._info_cache: dict[str, tuple[ChannelInfo | None, float]] = {}
+        # Условные запросы: ETag/Last-Modified и хеш тела по каналам —
+        # тихий канал не качается и не парсится заново каждый цикл
+        self._cond_headers: dict[str, dict[str, str]] = {}
+        self._body_hashes: dict[str, str] = {}
+        # Совпавшие по времени запросы одного канала (scheduler + /refresh)
+        # ждут один и тот же fetch, а не дублируют его
+        self._inflight: dict[tuple[str, int], asyncio.Future] = {}
         self.client = httpx.AsyncClient(
             timeout=self.TIMEOUT,
             headers={
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
             },
             follow_redirects=True,
+            # Явный пул keep-alive соединений: пачка запросов к t.me
+            # (массовый /add, цикл проверки) не платит TLS handshake за
+            # каждый вызов, а HTTP/2 мультиплексирует параллельные
+            # запросы через одно TLS-соединение
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=1,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=50,
+                    keepalive_expiry=60.0,
+                ),
+            ),
         )
 
     async def close(self):
         await self.client.aclose()
 
     async def get_channel_info(self, username: str) -> ChannelInfo | None:
-        """Получает информацию о канале"""
-        try:
-            # Добавляем случайную задержку для избежания rate limit
-            await asyncio.sleep(random.uniform(0.5, 1.5))
+        """Получает информацию о канале (кешируется на 24 часа)"""
+        cached = self._info_cache.get(username)
+        if cached and time.monotonic() - cached[1] < self.INFO_TTL:
+            return cached[0]
 
+        try:
             url = f"https://t.me/{username}"
-            response = await self.client.get(url)
+            async with self.limiter:
+                response = await self.client.get(url)
 
             if response.status_code != 200:
                 logger.warning(f"Failed to fetch channel info for {username}: {response.status_code}")
                 return None
 
-            soup = BeautifulSoup(response.text, "html.parser")
+            # Байты напрямую в lexbor: декодирование charset'а делает C-код,
+            # без промежуточной str-копии всей страницы
+            tree = LexborHTMLParser(response.content)
 
             # Извлекаем данные из OpenGraph тегов
             title = None
             description = None
             photo_url = None
 
-            og_title = soup.find("meta", property="og:title")
+            og_title = tree.css_first('meta[property="og:title"]')
             if og_title:
-                title = og_title.get("content")
+                title = og_title.attributes.get("content")
 
-            og_description = soup.find("meta", property="og:description")
+            og_description = tree.css_first('meta[property="og:description"]')
             if og_description:
-                description = og_description.get("content")
+                description = og_description.attributes.get("content")
 
-            og_image = soup.find("meta", property="og:image")
+            og_image = tree.css_first('meta[property="og:image"]')
             if og_image:
-                photo_url = og_image.get("content")
+                photo_url = og_image.attributes.get("content")
 
             # Количество подписчиков
             subscribers = None
-            subs_elem = soup.find("div", class_="tgme_page_extra")
+            subs_elem = tree.css_first("div.tgme_page_extra")
             if subs_elem:
-                subscribers = subs_elem.text.strip()
+                subscribers = subs_elem.text().strip()
 
-            return ChannelInfo(
+            info = ChannelInfo(
                 username=username,
                 title=title,
                 description=description,
                 subscribers=subscribers,
                 photo_url=photo_url,
             )
+            self._info_cache[username] = (info, time.monotonic())
+            return info
 
         except Exception as e:
             logger.error(f"Error fetching channel info for {username}: {e}")
             return None
 
     async def get_posts(self, username: str, after_post_id: int = 0) -> list[ParsedPost]:
-        """Получает посты из канала"""
+        """Получает посты из канала (параллельные вызовы делят один fetch)"""
+        key = (username, after_post_id)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await inflight
+
+        task = asyncio.ensure_future(self._fetch_posts(username, after_post_id))
+        self._inflight[key] = task
         try:
-            # Добавляем случайную задержку
-            await asyncio.sleep(random.uniform(0.5, 1.5))
+            return await task
+        finally:
+            self._inflight.pop(key, None)
 
-            # Добавляем timestamp для обхода кэша
-            url = f"{self.BASE_URL}/{username}?_={int(datetime.now().timestamp())}"
-            response = await self.client.get(url)
+    async def _fetch_posts(self, username: str, after_post_id: int) -> list[ParsedPost]:
+        """Скачивает и парсит страницу канала"""
+        try:
+            # Без cache-buster'а: свежесть обеспечивают заголовки
+            # Cache-Control/ETag, а уникальный URL только ломал HTTP-кеш
+            url = f"{self.BASE_URL}/{username}"
+            # Бутстрап канала (after_post_id == 0, например повторный
+            # /add) обязан вернуть реальные посты: 304/совпавший хеш
+            # значат «не изменилось с прошлого fetch'а», а не «постов
+            # нет», и пустой ответ обнулил бы last_post_id — следующий
+            # цикл разослал бы подписчикам целую страницу старья
+            bootstrap = after_post_id == 0
+            async with self.limiter:
+                response = await self.client.get(
+                    url, headers=None if bootstrap else self._cond_headers.get(username)
+                )
+
+            if response.status_code == 304:
+                logger.debug(f"No changes for @{username} (304)")
+                return []
 
             if response.status_code != 200:
                 logger.warning(f"Failed to fetch posts for {username}: {response.status_code}")
                 return []
 
-            soup = BeautifulSoup(response.text, "html.parser")
-            posts = []
-
-            # Парсим все сообщения
-            for msg in soup.find_all("div", class_="tgme_widget_message"):
-                try:
-                    # Извлекаем ID поста
-                    data_post = msg.get("data-post", "")
-                    if "/" not in data_post:
-                        continue
-
-                    post_id = int(data_post.split("/")[1])
-
-                    # Пропускаем старые посты
-                    if post_id <= after_post_id:
-                        continue
-
-                    # Текст сообщения
-                    text_elem = msg.find("div", class_="tgme_widget_message_text")
-                    content = text_elem.get_text(strip=True) if text_elem else ""
-
-                    # Дата
-                    date = None
-                    time_elem = msg.find("time", class_="datetime")
-                    if time_elem and time_elem.get("datetime"):
-                        try:
-                            date = datetime.fromisoformat(time_elem["datetime"].replace("Z", "+00:00"))
-                        except ValueError:
-                            pass
-
-                    # Просмотры
-                    views = None
-                    views_elem = msg.find("span", class_="tgme_widget_message_views")
-                    if views_elem:
-                        views = views_elem.text.strip()
-
-                    # Изображения
-                    images = []
-                    for img in msg.find_all("a", class_="tgme_widget_message_photo_wrap"):
-                        style = img.get("style", "")
-                        if "background-image" in style:
-                            # Извлекаем URL из style="background-image:url('...')"
-                            start = style.find("url('") + 5
-                            end = style.find("')", start)
-                            if start > 4 and end > start:
-                                images.append(style[start:end])
-
-                    if content:  # Только посты с текстом
-                        posts.append(ParsedPost(
-                            post_id=post_id,
-                            content=content,
-                            date=date,
-                            views=views,
-                            images=images,
-                        ))
-
-                except Exception as e:
-                    logger.error(f"Error parsing post: {e}")
-                    continue
+            cond: dict[str, str] = {}
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+            if etag:
+                cond["If-None-Match"] = etag
+            if last_modified:
+                cond["If-Modified-Since"] = last_modified
+            if cond:
+                self._cond_headers[username] = cond
+
+            # Страховка, если t.me не отдаёт валидаторы: неизменившееся
+            # тело не перепарсиваем
+            html = response.content
+            body_hash = hashlib.sha1(html).hexdigest()
+            if not bootstrap and self._body_hashes.get(username) == body_hash:
+                logger.debug(f"No changes for @{username} (same body)")
+                return []
+            self._body_hashes[username] = body_hash
 
-            # Сортируем по ID (новые первые)
-            posts.sort(key=lambda p: p.post_id, reverse=True)
+            # Быстрый отсев до построения DOM: нет ни одного блока
+            # сообщения — нечего парсить
+            if b"tgme_widget_message" not in html:
+                return []
+
+            # Парсинг — чистый CPU: уводим в поток, чтобы не блокировать
+            # event loop, пока несколько каналов парсятся одновременно
+            posts = await asyncio.to_thread(
+                self._parse_posts, html, after_post_id
+            )
 
             logger.info(f"Parsed {len(posts)} new posts from @{username}")
             return posts
@@ -179,11 +216,97 @@ class ChannelParser:
             logger.error(f"Error fetching posts for {username}: {e}")
             return []
 
+    @staticmethod
+    def _parse_posts(html: bytes, after_post_id: int) -> list[ParsedPost]:
+        """Синхронный разбор HTML страницы канала (выполняется в потоке)"""
+        tree = LexborHTMLParser(html)
+        posts = []
+
+        # Парсим все сообщения (lexbor — C-парсер, в разы быстрее
+        # чистопитоновского html.parser на 200KB страницах t.me)
+        for msg in tree.css("div.tgme_widget_message"):
+            try:
+                # Извлекаем ID поста
+                data_post = msg.attributes.get("data-post") or ""
+                if "/" not in data_post:
+                    continue
+
+                post_id = int(data_post.split("/")[1])
+
+                # Пропускаем старые посты
+                if post_id <= after_post_id:
+                    continue
+
+                # Текст сообщения
+                text_elem = msg.css_first("div.tgme_widget_message_text")
+                content = text_elem.text(strip=True) if text_elem else ""
+
+                # Дата
+                date = None
+                time_elem = msg.css_first("time.datetime")
+                raw_dt = time_elem.attributes.get("datetime") if time_elem else None
+                if raw_dt:
+                    try:
+                        date = datetime.fromisoformat(raw_dt.replace("Z", "+00:00"))
+                    except ValueError:
+                        pass
+
+                # Просмотры
+                views = None
+                views_elem = msg.css_first("span.tgme_widget_message_views")
+                if views_elem:
+                    views = views_elem.text().strip()
+
+                # Изображения
+                images = []
+                for img in msg.css("a.tgme_widget_message_photo_wrap"):
+                    style = img.attributes.get("style") or ""
+                    bg = _BG_RE.search(style)
+                    if bg:
+                        images.append(bg.group(1))
+
+                if content:  # Только посты с текстом
+                    posts.append(ParsedPost(
+                        post_id=post_id,
+                        content=content,
+                        date=date,
+                        views=views,
+                        images=images,
+                    ))
+
+            except Exception as e:
+                logger.error(f"Error parsing post: {e}")
+                continue
+
+        # Сортируем по ID (новые первые)
+        posts.sort(key=lambda p: p.post_id, reverse=True)
+        return posts
+
     async def is_channel_public(self, username: str) -> bool:
-        """Проверяет, публичный ли канал"""
+        """Проверяет, публичный ли канал (кешируется на час)"""
+        cached = self._public_cache.get(username)
+        if cached and time.monotonic() - cached[1] < self.PUBLIC_TTL:
+            return cached[0]
+
         try:
             url = f"{self.BASE_URL}/{username}"
-            response = await self.client.get(url)
-            return response.status_code == 200
+            async with self.limiter:
+                response = await self.client.get(url)
+            is_public = response.status_code == 200
         except Exception:
+            # Сетевую ошибку не кешируем — следующий вызов попробует снова
             return False
+
+        self._public_cache[username] = (is_public, time.monotonic())
+        return is_public
+
+
+# Ленивая инициализация
+_channel_parser = None
+
+
+def get_channel_parser() -> ChannelParser:
+    global _channel_parser
+    if _channel_parser is None:
+        _channel_parser = ChannelParser()
+    return _channel_parser
@@ -1,19 +1,45 @@
 import asyncio
+import functools
+import hashlib
 import logging
+from collections import OrderedDict
+import os
 import random
+import time
+import weakref
 from datetime import datetime
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from aiolimiter import AsyncLimiter
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramRetryAfter
+
+import telegramify_markdown
+from telegramify_markdown import customize
+
+customize.strict_markdown = False
+
+# Локальная ссылка — один attribute lookup при импорте, а не на каждую отправку
+_markdownify = telegramify_markdown.markdownify
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.db.database import get_async_session
-from app.db.models import Channel, Subscription, Post
-from app.services.parser import ChannelParser
-from app.services.summarizer import Summarizer
+from app.db.models import Channel, Subscription, Post, User
+from app.services.parser import get_channel_parser
+from app.services.summarizer import get_summarizer
 from app.services.userbot import get_userbot_service, AuthState
-from app.services.transcription import TranscriptionService
+from app.services.transcription import TranscriptionService, schedule_client_close
 
 logger = logging.getLogger(__name__)
 
+
+@functools.lru_cache(maxsize=4096)
+def _render_body(channel: str, summary: str, post_id: int, type_label: str) -> str:
+    """Тело сообщения без маркера интересов — одно на всех получателей поста"""
+    if type_label:
+        return f"**{type_label.strip()}**\n\n{summary}\n\n[Открыть в @{channel} →](https://t.me/{channel}/{post_id})"
+    return f"{summary}\n\n[Открыть в @{channel} →](https://t.me/{channel}/{post_id})"
+
+
 # Глобальный экземпляр scheduler
 _scheduler_instance = None
 
@@ -32,19 +58,59 @@ def set_scheduler(scheduler):
 class Scheduler:
     """Фоновый планировщик для проверки каналов"""
 
+    # Долгоживущий HTTP-клиент транскрибера пересоздаём раз в час,
+    # чтобы не копить буферы и зависшие соединения
+    TRANSCRIBER_TTL = 3600.0
+
     def __init__(self, bot, interval_seconds: int = 30):
         self.bot = bot
         self.interval_seconds = interval_seconds
-        self.parser = ChannelParser()
-        self.summarizer = Summarizer()
+        # Общие синглтоны: один httpx-пул и один LLM-клиент на процесс,
+        # даже если Scheduler пересоздаётся
+        self.parser = get_channel_parser()
+        self.summarizer = get_summarizer()
         self._transcriber: TranscriptionService | None = None
+        self._transcriber_created_at = 0.0
         self._running = False
         self._task: asyncio.Task | None = None
+        # Ранний wakeup вместо cancel: остановка и /refresh будят цикл,
+        # не прерывая его посреди транзакции или HTTP-запроса
+        self._wake_event = asyncio.Event()
+        # Каналы независимы — обрабатываем параллельно, но ограниченно,
+        # чтобы не упереться в rate limit t.me и Gemini
+        self._check_sem = asyncio.Semaphore(int(os.getenv("CHECK_CONCURRENCY", "8")))
+        # Параллельные вызовы Gemini тоже ограничиваем; бюджет RPM
+        # держит общий токен-бакет внутри Summarizer
+        self._summarize_sem = asyncio.Semaphore(4)
+        # Рассылка: глобальный лимит Telegram ~30 сообщений/сек
+        self._send_sem = asyncio.Semaphore(25)
+        self._send_limiter = AsyncLimiter(max_rate=29, time_period=1.0)
+        # Ответ LLM детерминирован по паре (резюме, интересы) — у
+        # пользователей с одинаковыми интересами не сжигаем квоту повторно.
+        # LRU: при переполнении вытесняем самую давнюю пару
+        self._interest_cache: OrderedDict[tuple[int, int], bool] = OrderedDict()
+        # Единая метка времени цикла: один вызов utcnow() на проверку,
+        # все каналы цикла получают одинаковый last_checked_at
+        self._cycle_now: datetime | None = None
+        # Дедупликация LLM-работы в рамках цикла: кросспостинг и
+        # повторная обработка одного контента не жгут квоту дважды
+        self._summary_cache: dict[bytes, tuple[str, dict]] = {}
 
     def _get_transcriber(self) -> TranscriptionService:
-        """Ленивая инициализация транскрибера"""
+        """Ленивая инициализация транскрибера с периодическим пересозданием"""
+        now = time.monotonic()
+        if (
+            self._transcriber is not None
+            and now - self._transcriber_created_at > self.TRANSCRIBER_TTL
+        ):
+            # Ссылку просто отпускаем: finalize закроет клиент, когда
+            # его отпустят и транскрипции в полёте
+            self._transcriber = None
         if self._transcriber is None:
-            self._transcriber = TranscriptionService()
+            service = TranscriptionService()
+            weakref.finalize(service, schedule_client_close, service.client)
+            self._transcriber = service
+            self._transcriber_created_at = now
         return self._transcriber
 
     async def start(self):
@@ -59,32 +125,54 @@ class Scheduler:
     async def stop(self):
         """Останавливает scheduler"""
         self._running = False
+        self._wake_event.set()
         if self._task:
-            self._task.cancel()
             try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
-        await self.parser.close()
+                # Даём текущему циклу дозавершиться, cancel — крайний случай
+                await asyncio.wait_for(self._task, timeout=30)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+        if self._transcriber is not None:
+            await self._transcriber.aclose()
+            self._transcriber = None
+        # parser — общий синглтон, его закрывает lifespan приложения
         logger.info("Scheduler stopped")
 
+    def trigger_now(self):
+        """Будит цикл для немедленной проверки (для /refresh)"""
+        self._wake_event.set()
+
     async def _run_loop(self):
         """Основной цикл проверки"""
+        loop = asyncio.get_running_loop()
         while self._running:
+            started = loop.time()
             try:
                 await self._check_channels()
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
 
-            # Рандомизация интервала ±30% для избежания детекции паттернов
-            # Например: 30 сек становится 21-39 сек
-            jitter = random.uniform(0.7, 1.3)
-            sleep_time = self.interval_seconds * jitter
+            # Дедлайн отсчитывается от НАЧАЛА цикла: время самой проверки
+            # не дрейфует интервал, долгий цикл просто стартует следующий
+            # сразу. Джиттер ±10% размазывает запросы к t.me по времени
+            deadline = started + self.interval_seconds * random.uniform(0.9, 1.1)
+            sleep_time = max(0.0, deadline - loop.time())
             logger.debug(f"Next check in {sleep_time:.1f}s (base: {self.interval_seconds}s)")
-            await asyncio.sleep(sleep_time)
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=sleep_time)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
 
     async def _check_channels(self):
         """Проверяет все активные каналы на новые посты"""
+        self._cycle_now = datetime.utcnow()
+        self._summary_cache = {}
+
         # Проверяем доступность userbot
         userbot = get_userbot_service()
         userbot_status = await userbot.get_status()
@@ -97,100 +185,322 @@ class Scheduler:
 
         async with get_async_session()() as session:
             # Получаем только каналы С ПОДПИСКАМИ (не пустые)
-            from app.db.models import Subscription
             result = await session.execute(
-                select(Channel)
+                select(Channel.id)
                 .where(Channel.is_active == True)
                 .where(Channel.subscriptions.any())  # Только каналы с подписками
-                .options(selectinload(Channel.subscriptions).selectinload(Subscription.user))
             )
-            channels = result.scalars().all()
+            channel_ids = result.scalars().all()
 
-            if not channels:
+            if not channel_ids:
                 logger.debug("No channels with subscriptions to check")
                 return
 
-            logger.info(f"Checking {len(channels)} channels...")
+            # Получатели всех каналов одним JOIN-запросом: дальше по
+            # горячему пути ходим по plain-словарю, а не по ORM-связям
+            recipients_result = await session.execute(
+                select(Subscription.channel_id, User.telegram_id, User.interests)
+                .join(User, User.id == Subscription.user_id)
+                .where(Subscription.channel_id.in_(channel_ids))
+            )
+            recipients_by_channel: dict[int, list[tuple[int, str | None]]] = {}
+            for channel_id, telegram_id, interests in recipients_result:
+                recipients_by_channel.setdefault(channel_id, []).append(
+                    (telegram_id, interests)
+                )
+
+        logger.info(f"Checking {len(channel_ids)} channels...")
+
+        # Каналы обрабатываются параллельно под семафором — общее время
+        # цикла перестаёт быть суммой задержек по всем каналам
+        await asyncio.gather(
+            *[
+                self._process_channel_guarded(
+                    channel_id,
+                    recipients_by_channel.get(channel_id, []),
+                    userbot_available,
+                )
+                for channel_id in channel_ids
+            ],
+            return_exceptions=True,
+        )
+
+    async def _process_channel_guarded(
+        self,
+        channel_id: int,
+        recipients: list[tuple[int, str | None]],
+        userbot_available: bool,
+    ):
+        """Обрабатывает канал в собственной сессии под семафором"""
+        async with self._check_sem:
+            # Сессия не потокобезопасна между задачами — каждой своя
+            async with get_async_session()() as session:
+                # Core-select нужных колонок: без гидрации ORM-объекта,
+                # identity map и связей — горячему пути хватает tuple
+                result = await session.execute(
+                    select(
+                        Channel.id,
+                        Channel.username,
+                        Channel.last_post_id,
+                        Channel.is_active,
+                    ).where(Channel.id == channel_id)
+                )
+                channel = result.first()
+                if channel is None or not channel.is_active:
+                    return
 
-            for i, channel in enumerate(channels):
                 try:
-                    await self._process_channel(session, channel, userbot_available)
+                    await self._process_channel(session, channel, recipients, userbot_available)
+                    await session.commit()
                 except Exception as e:
+                    await session.rollback()
                     logger.error(f"Error processing channel @{channel.username}: {e}")
 
-                # Случайная задержка между каналами (1-3 сек) для имитации человека
-                if i < len(channels) - 1:
-                    delay = random.uniform(1.0, 3.0)
-                    await asyncio.sleep(delay)
-
-            await session.commit()
-
-    async def _process_channel(self, session, channel: Channel, userbot_available: bool = False):
+    async def _process_channel(
+        self,
+        session,
+        channel,
+        recipients: list[tuple[int, str | None]],
+        userbot_available: bool = False,
+    ):
         """Обрабатывает один канал"""
         # Если userbot доступен, используем его для полного парсинга
         if userbot_available:
-            await self._process_channel_with_userbot(session, channel)
+            await self._process_channel_with_userbot(session, channel, recipients)
         else:
-            await self._process_channel_web(session, channel)
+            await self._process_channel_web(session, channel, recipients)
 
-    async def _process_channel_web(self, session, channel: Channel):
+    async def _process_channel_web(
+        self,
+        session,
+        channel,
+        recipients: list[tuple[int, str | None]],
+    ):
         """Обрабатывает канал через веб-парсинг (только текст и фото)"""
         posts = await self.parser.get_posts(channel.username, channel.last_post_id)
 
         if not posts:
-            channel.last_checked_at = datetime.utcnow()
+            await self._touch_channel(session, channel)
             return
 
         logger.info(f"[WEB] Found {len(posts)} new posts in @{channel.username}")
 
-        for post in posts:
-            existing = await session.execute(
-                select(Post).where(
+        # Проверка существования всех постов одним IN-запросом вместо
+        # SELECT на каждый пост (классический N+1)
+        new_post_ids = [
+            p.post_id for p in posts if p.post_id > channel.last_post_id
+        ]
+        existing_ids: set[int] = set()
+        if new_post_ids:
+            existing_result = await session.execute(
+                select(Post.post_id).where(
                     Post.channel_id == channel.id,
-                    Post.post_id == post.post_id
+                    Post.post_id.in_(new_post_ids),
                 )
             )
-            if existing.scalar_one_or_none():
+            existing_ids = set(existing_result.scalars().all())
+
+        new_posts = [
+            p for p in posts
+            if p.post_id > channel.last_post_id and p.post_id not in existing_ids
+        ]
+
+        # Этап 1: все резюме параллельно (под семафором Gemini)
+        summaries = await asyncio.gather(
+            *[
+                self._summarize_limited(p.content, channel.username)
+                for p in new_posts
+            ],
+            return_exceptions=True,
+        )
+
+        # Этап 2: все посты одним multi-row INSERT; ON CONFLICT
+        # страхует от гонки с параллельным циклом
+        post_rows = []
+        to_send = []
+        for post, result in zip(new_posts, summaries):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to summarize post {post.post_id}: {result}")
                 continue
+            summary, stats = result
+            post_rows.append({
+                "channel_id": channel.id,
+                "post_id": post.post_id,
+                "content": post.content,
+                "summary": summary,
+            })
+            to_send.append((post.post_id, summary))
+        if post_rows:
+            await session.execute(
+                pg_insert(Post)
+                .values(post_rows)
+                .on_conflict_do_nothing(index_elements=["channel_id", "post_id"])
+            )
 
-            try:
-                summary, stats = await self.summarizer.summarize(
-                    post.content,
-                    channel.username
+        # Этап 3: рассылка всем подписчикам параллельно под лимитом
+        # Telegram — время цикла перестаёт быть суммой round-trip'ов
+        if to_send:
+            # Кеш отформатированного текста у каждого поста общий на
+            # всех получателей — markdownify зовётся 1-2 раза, а не N
+            caches = {post_id: {} for post_id, _ in to_send}
+            # Интересы всей пачки постов: один запрос на уникальный
+            # профиль, а не на каждый пост
+            interest_maps = dict(zip(
+                [post_id for post_id, _ in to_send],
+                await self._check_interests_maps(
+                    [summary for _, summary in to_send], recipients
+                ),
+            ))
+            await asyncio.gather(*[
+                self._send_with_limit(
+                    telegram_id, channel.username, summary, post_id,
+                    is_interesting=bool(interests) and interest_maps[post_id].get(interests, False),
+                    formatted_cache=caches[post_id],
                 )
-                # Задержка для Gemini rate limit (15 RPM)
-                await asyncio.sleep(5)
-            except Exception as e:
-                logger.error(f"Failed to summarize post {post.post_id}: {e}")
+                for post_id, summary in to_send
+                for telegram_id, interests in recipients
+            ])
+
+        await self._touch_channel(
+            session, channel, last_post_id=max(p.post_id for p in posts)
+        )
+
+    async def _touch_channel(self, session, channel, last_post_id: int | None = None):
+        """Обновляет last_checked_at (и last_post_id) одним UPDATE без ORM-flush"""
+        values: dict = {"last_checked_at": self._cycle_now or datetime.utcnow()}
+        if last_post_id is not None and last_post_id > channel.last_post_id:
+            values["last_post_id"] = last_post_id
+        await session.execute(
+            update(Channel).where(Channel.id == channel.id).values(**values)
+        )
+
+    async def _summarize_limited(self, content: str, channel_name: str):
+        """Суммаризация под семафором (для gather-пачек) с дедупликацией"""
+        key = hashlib.sha256(content.encode()).digest()
+        cached = self._summary_cache.get(key)
+        if cached is not None:
+            return cached
+        async with self._summarize_sem:
+            result = await self.summarizer.summarize(content, channel_name)
+        self._summary_cache[key] = result
+        return result
+
+    async def _check_interests_map(
+        self,
+        summary: str,
+        recipients: list[tuple[int, str | None]],
+    ) -> dict[str, bool]:
+        """
+        Проверяет интересы один раз на пост: уникальные профили
+        получателей уходят в Gemini одним батч-запросом, известные
+        пары (резюме, интересы) берутся из кеша.
+        """
+        result: dict[str, bool] = {}
+        missing: list[str] = []
+        for _, interests in recipients:
+            if not interests or interests in result or interests in missing:
                 continue
+            cached = self._interest_cache.get((hash(summary), hash(interests)))
+            if cached is not None:
+                self._interest_cache.move_to_end((hash(summary), hash(interests)))
+                result[interests] = cached
+            else:
+                missing.append(interests)
 
-            db_post = Post(
-                channel_id=channel.id,
-                post_id=post.post_id,
-                content=post.content,
-                summary=summary,
-            )
-            session.add(db_post)
+        if missing:
+            try:
+                flags = await self.summarizer.check_interests_batch(summary, missing)
+            except Exception as e:
+                logger.error(f"Batch interest check failed: {e}")
+                flags = [False] * len(missing)
+            for interests, flag in zip(missing, flags):
+                result[interests] = flag
+                self._interest_cache[(hash(summary), hash(interests))] = flag
+            while len(self._interest_cache) > 1024:
+                self._interest_cache.popitem(last=False)
 
-            for subscription in channel.subscriptions:
+        return result
+
+    async def _check_interests_maps(
+        self,
+        summaries: list[str],
+        recipients: list[tuple[int, str | None]],
+    ) -> list[dict[str, bool]]:
+        """
+        Проверяет интересы для пачки постов цикла: промахи кеша
+        группируются по профилю и уходят в Gemini одним запросом на
+        профиль — N постов перестают стоить N round-trip'ов.
+        """
+        profiles: list[str] = []
+        for _, interests in recipients:
+            if interests and interests not in profiles:
+                profiles.append(interests)
+
+        maps: list[dict[str, bool]] = [{} for _ in summaries]
+        # Профиль -> индексы постов, которых нет в кеше
+        pending: dict[str, list[int]] = {}
+        for idx, summary in enumerate(summaries):
+            for interests in profiles:
+                key = (hash(summary), hash(interests))
+                cached = self._interest_cache.get(key)
+                if cached is not None:
+                    self._interest_cache.move_to_end(key)
+                    maps[idx][interests] = cached
+                else:
+                    pending.setdefault(interests, []).append(idx)
+
+        async def check_profile(interests: str, idxs: list[int]):
+            try:
+                flags = await self.summarizer.check_interests_posts(
+                    [summaries[i] for i in idxs], interests
+                )
+            except Exception as e:
+                logger.error(f"Posts interest check failed: {e}")
+                flags = [False] * len(idxs)
+            for i, flag in zip(idxs, flags):
+                maps[i][interests] = flag
+                self._interest_cache[(hash(summaries[i]), hash(interests))] = flag
+
+        if pending:
+            await asyncio.gather(*[
+                check_profile(interests, idxs)
+                for interests, idxs in pending.items()
+            ])
+            while len(self._interest_cache) > 1024:
+                self._interest_cache.popitem(last=False)
+
+        return maps
+
+    async def _send_with_limit(
+        self,
+        telegram_id: int,
+        channel_username: str,
+        summary: str,
+        post_id: int,
+        is_interesting: bool = False,
+        formatted_cache: dict[str, str] | None = None,
+    ):
+        """Отправка резюме под семафором и глобальным лимитом Telegram"""
+        async with self._send_sem:
+            async with self._send_limiter:
                 try:
                     await self._send_summary(
-                        subscription.user.telegram_id,
-                        channel.username,
+                        telegram_id,
+                        channel_username,
                         summary,
-                        post.post_id,
-                        user_interests=subscription.user.interests
+                        post_id,
+                        is_interesting=is_interesting,
+                        formatted_cache=formatted_cache,
                     )
                 except Exception as e:
-                    logger.error(f"Failed to send to user {subscription.user.telegram_id}: {e}")
-
-        max_post_id = max(p.post_id for p in posts)
-        if max_post_id > channel.last_post_id:
-            channel.last_post_id = max_post_id
-
-        channel.last_checked_at = datetime.utcnow()
+                    logger.error(f"Failed to send to user {telegram_id}: {e}")
 
-    async def _process_channel_with_userbot(self, session, channel: Channel):
+    async def _process_channel_with_userbot(
+        self,
+        session,
+        channel,
+        recipients: list[tuple[int, str | None]],
+    ):
         """Обрабатывает канал через userbot (включая голосовые, кружки, видео и фото)"""
         userbot = get_userbot_service()
         messages = await userbot.get_channel_messages(
@@ -200,7 +510,7 @@ class Scheduler:
         )
 
         if not messages:
-            channel.last_checked_at = datetime.utcnow()
+            await self._touch_channel(session, channel)
             return
 
         logger.info(f"[USERBOT] Found {len(messages)} new messages in @{channel.username}")
@@ -208,21 +518,28 @@ class Scheduler:
         # Группируем сообщения по media_group_id для обработки альбомов
         grouped_messages = self._group_messages_by_album(messages)
 
+        # Существующие посты одним IN-запросом на весь батч, а не
+        # SELECT'ом на каждую группу (колонка вместо ORM-сущности)
+        existing_result = await session.execute(
+            select(Post.post_id).where(
+                Post.channel_id == channel.id,
+                Post.post_id.in_([m["id"] for m in messages]),
+            )
+        )
+        existing_ids = set(existing_result.scalars().all())
+
         for group_key, group_msgs in grouped_messages.items():
             try:
                 await self._process_message_group(
-                    session, channel, userbot, group_msgs
+                    session, channel, userbot, group_msgs, recipients, existing_ids
                 )
             except Exception as e:
                 logger.error(f"Error processing message group in @{channel.username}: {e}")
 
-        # Обновляем last_post_id
-        if messages:
-            max_post_id = max(m["id"] for m in messages)
-            if max_post_id > channel.last_post_id:
-                channel.last_post_id = max_post_id
-
-        channel.last_checked_at = datetime.utcnow()
+        # Обновляем last_post_id и last_checked_at одним UPDATE
+        await self._touch_channel(
+            session, channel, last_post_id=max(m["id"] for m in messages)
+        )
 
     def _group_messages_by_album(self, messages: list[dict]) -> dict[str, list[dict]]:
         """
@@ -246,9 +563,11 @@ class Scheduler:
     async def _process_message_group(
         self,
         session,
-        channel: Channel,
+        channel,
         userbot,
-        messages: list[dict]
+        messages: list[dict],
+        recipients: list[tuple[int, str | None]],
+        existing_ids: set[int],
     ):
         """
         Обрабатывает группу сообщений (альбом или одиночное сообщение).
@@ -257,14 +576,8 @@ class Scheduler:
         primary_msg = messages[0]
         msg_id = primary_msg["id"]
 
-        # Проверяем, не обрабатывали ли уже
-        existing = await session.execute(
-            select(Post).where(
-                Post.channel_id == channel.id,
-                Post.post_id == msg_id
-            )
-        )
-        if existing.scalar_one_or_none():
+        # Проверяем, не обрабатывали ли уже (набор предзагружен)
+        if msg_id in existing_ids:
             return
 
         # Собираем весь контент из группы
@@ -273,6 +586,8 @@ class Scheduler:
         images = []
         content_types = set()
 
+        audio_msgs = []
+        photo_msgs = []
         for msg in messages:
             # Текст (берём из первого сообщения с текстом)
             msg_text = msg.get("text", "")
@@ -283,33 +598,80 @@ class Scheduler:
             media_type = msg.get("media_type", "text")
             all_media = msg.get("all_media_types", [])
 
-            # Обрабатываем аудио-контент (голосовые, кружки, аудио, видео)
             if media_type in ("voice", "video_note", "audio", "video"):
-                try:
-                    media_data = await userbot.download_media(channel.username, msg["id"])
-                    if media_data:
-                        ext = ".ogg" if media_type == "voice" else ".mp4"
-                        transcript = await self._get_transcriber().transcribe_bytes(
-                            media_data,
-                            filename=f"media{ext}"
-                        )
-                        if transcript:
-                            audio_transcript += f"\n{transcript}" if audio_transcript else transcript
-                            content_types.add(media_type)
-                            logger.info(f"Transcribed {media_type} from @{channel.username}/{msg['id']}")
-                except Exception as e:
-                    logger.error(f"Failed to transcribe {media_type} from @{channel.username}/{msg['id']}: {e}")
-
-            # Обрабатываем фото
+                audio_msgs.append(msg)
             if "photo" in all_media or media_type == "photo":
+                photo_msgs.append(msg)
+
+        # Фаза A: все загрузки медиа группы параллельно — альбом из
+        # 10 фото качается за max(t), а не за сумму
+        audio_results, photo_results = await asyncio.gather(
+            asyncio.gather(
+                *[
+                    userbot.download_media_to_path(
+                        channel.username,
+                        m["id"],
+                        suffix=".ogg" if m.get("media_type") == "voice" else ".mp4",
+                    )
+                    for m in audio_msgs
+                ],
+                return_exceptions=True,
+            ),
+            asyncio.gather(
+                *[userbot.download_photo(channel.username, m["id"]) for m in photo_msgs],
+                return_exceptions=True,
+            ),
+        )
+
+        # Фаза B: транскрипция скачанного аудио тоже параллельно.
+        # Аудио уходит в Whisper прямо с диска — видео на десятки МБ не
+        # висит bytes-объектом в памяти на время транскрипции
+        to_transcribe = []
+        for msg, media_path in zip(audio_msgs, audio_results):
+            media_type = msg.get("media_type", "text")
+            if isinstance(media_path, BaseException):
+                logger.error(f"Failed to download {media_type} from @{channel.username}/{msg['id']}: {media_path}")
+            elif media_path:
+                to_transcribe.append((msg, media_path))
+
+        try:
+            if len(to_transcribe) > 1:
+                # Несколько клипов в одной медиагруппе — склеиваем и
+                # транскрибируем одним запросом вместо N
+                transcripts = await self._get_transcriber().transcribe_batch(
+                    [path for _, path in to_transcribe]
+                )
+            else:
+                transcripts = await asyncio.gather(
+                    *[
+                        self._get_transcriber().transcribe(path)
+                        for _, path in to_transcribe
+                    ],
+                    return_exceptions=True,
+                )
+        finally:
+            for _, path in to_transcribe:
                 try:
-                    photo_data = await userbot.download_photo(channel.username, msg["id"])
-                    if photo_data:
-                        images.append(photo_data)
-                        content_types.add("photo")
-                        logger.info(f"Downloaded photo from @{channel.username}/{msg['id']}")
-                except Exception as e:
-                    logger.error(f"Failed to download photo from @{channel.username}/{msg['id']}: {e}")
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+        for (msg, _), transcript in zip(to_transcribe, transcripts):
+            media_type = msg.get("media_type", "text")
+            if isinstance(transcript, BaseException):
+                logger.error(f"Failed to transcribe {media_type} from @{channel.username}/{msg['id']}: {transcript}")
+            elif transcript:
+                audio_transcript += f"\n{transcript}" if audio_transcript else transcript
+                content_types.add(media_type)
+                logger.info(f"Transcribed {media_type} from @{channel.username}/{msg['id']}")
+
+        for msg, photo_data in zip(photo_msgs, photo_results):
+            if isinstance(photo_data, BaseException):
+                logger.error(f"Failed to download photo from @{channel.username}/{msg['id']}: {photo_data}")
+            elif photo_data:
+                images.append(photo_data)
+                content_types.add("photo")
+                logger.info(f"Downloaded photo from @{channel.username}/{msg['id']}")
 
         # Проверяем есть ли что суммаризировать
         has_content = text_content or audio_transcript or images
@@ -317,20 +679,32 @@ class Scheduler:
             logger.debug(f"Skipping empty message group {msg_id} in @{channel.username}")
             return
 
-        # Создаём мультимодальное резюме
-        try:
-            summary, stats = await self.summarizer.summarize_multimodal(
-                text=text_content,
-                images=images,
-                audio_transcript=audio_transcript,
-                channel_name=channel.username,
-                content_types=list(content_types)
-            )
-            # Задержка для rate limit
-            await asyncio.sleep(5)
-        except Exception as e:
-            logger.error(f"Failed to summarize post {msg_id}: {e}")
-            return
+        # Создаём мультимодальное резюме (повтор того же контента в
+        # рамках цикла берётся из кеша без похода в LLM)
+        content_hash = hashlib.sha256()
+        content_hash.update(text_content.encode())
+        content_hash.update(audio_transcript.encode())
+        for img in images:
+            # blake2b как быстрый отпечаток картинки
+            content_hash.update(hashlib.blake2b(img, digest_size=16).digest())
+        content_key = content_hash.digest()
+
+        cached = self._summary_cache.get(content_key)
+        if cached is not None:
+            summary, stats = cached
+        else:
+            try:
+                summary, stats = await self.summarizer.summarize_multimodal(
+                    text=text_content,
+                    images=images,
+                    audio_transcript=audio_transcript,
+                    channel_name=channel.username,
+                    content_types=list(content_types)
+                )
+            except Exception as e:
+                logger.error(f"Failed to summarize post {msg_id}: {e}")
+                return
+            self._summary_cache[content_key] = (summary, stats)
 
         # Формируем полный контент для сохранения
         full_content = text_content
@@ -339,27 +713,44 @@ class Scheduler:
         if images:
             full_content += f"\n\n[ФОТО: {len(images)} шт]"
 
-        # Сохраняем пост
-        db_post = Post(
-            channel_id=channel.id,
-            post_id=msg_id,
-            content=full_content,
-            summary=summary,
+        # Сохраняем пост (ON CONFLICT — страховка от двойной обработки)
+        await session.execute(
+            pg_insert(Post)
+            .values(
+                channel_id=channel.id,
+                post_id=msg_id,
+                content=full_content,
+                summary=summary,
+            )
+            .on_conflict_do_nothing(index_elements=["channel_id", "post_id"])
         )
-        session.add(db_post)
 
-        # Отправляем резюме всем подписчикам (без type_label, т.к. он уже в summary)
-        for subscription in channel.subscriptions:
+        # Отправляем резюме всем подписчикам параллельно
+        # (без type_label, т.к. он уже в summary)
+        interest_map = await self._check_interests_map(summary, recipients)
+        formatted_cache: dict[str, str] = {}
+        await asyncio.gather(*[
+            self._send_with_limit(
+                telegram_id, channel.username, summary, msg_id,
+                is_interesting=bool(interests) and interest_map.get(interests, False),
+                formatted_cache=formatted_cache,
+            )
+            for telegram_id, interests in recipients
+        ])
+
+    async def _send_message_flood_safe(self, telegram_id: int, text: str, **kwargs):
+        """Отправка с уважением к flood control: на 429 ждём retry_after"""
+        for attempt in range(3):
             try:
-                await self._send_summary(
-                    subscription.user.telegram_id,
-                    channel.username,
-                    summary,
-                    msg_id,
-                    user_interests=subscription.user.interests
+                await self.bot.send_message(telegram_id, text, **kwargs)
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(
+                    f"Flood control for user {telegram_id}: waiting {e.retry_after}s"
                 )
-            except Exception as e:
-                logger.error(f"Failed to send to user {subscription.user.telegram_id}: {e}")
+                await asyncio.sleep(e.retry_after)
+        # Последняя попытка — исключение уходит вызывающему
+        await self.bot.send_message(telegram_id, text, **kwargs)
 
     async def _send_summary(
         self,
@@ -368,25 +759,14 @@ class Scheduler:
         summary: str,
         post_id: int,
         type_label: str = "",
-        user_interests: str | None = None
+        is_interesting: bool = False,
+        formatted_cache: dict[str, str] | None = None,
     ):
-        """Отправляет резюме пользователю с маркировкой по интересам"""
-        import telegramify_markdown
-        from telegramify_markdown import customize
-        from aiogram.enums import ParseMode
-
-        customize.strict_markdown = False
-
-        # Проверяем соответствие интересам
-        is_interesting = False
-        if user_interests:
-            try:
-                is_interesting = await self.summarizer.check_interests(summary, user_interests)
-                # Небольшая задержка после проверки (rate limit)
-                await asyncio.sleep(2)
-            except Exception as e:
-                logger.error(f"Interest check failed: {e}")
+        """Отправляет резюме пользователю с маркировкой по интересам
 
+        Соответствие интересам вычисляется заранее батчем на весь пост
+        (_check_interests_map) — здесь только форматирование и отправка.
+        """
         # Формируем маркер для важных постов
         # 🔥 — яркий маркер, хорошо виден при скролле
         interest_marker = ""
@@ -394,15 +774,19 @@ class Scheduler:
             interest_marker = "🔥🔥🔥 **ПО ТВОИМ ИНТЕРЕСАМ** 🔥🔥🔥\n\n"
             logger.info(f"[MARKER] Post matches interests for user {telegram_id}")
 
-        # Формируем сообщение
-        if type_label:
-            message = f"{interest_marker}**{type_label.strip()}**\n\n{summary}\n\n[Открыть в @{channel} →](https://t.me/{channel}/{post_id})"
-        else:
-            message = f"{interest_marker}{summary}\n\n[Открыть в @{channel} →](https://t.me/{channel}/{post_id})"
+        # Формируем сообщение (тело мемоизировано по посту)
+        message = interest_marker + _render_body(channel, summary, post_id, type_label)
 
         try:
-            formatted = telegramify_markdown.markdownify(message)
-            await self.bot.send_message(
+            # Текст детерминирован по (пост, маркер) — форматируем один
+            # раз и переиспользуем для всех получателей варианта
+            cache_key = "marked" if is_interesting else "base"
+            formatted = formatted_cache.get(cache_key) if formatted_cache is not None else None
+            if formatted is None:
+                formatted = _markdownify(message)
+                if formatted_cache is not None:
+                    formatted_cache[cache_key] = formatted
+            await self._send_message_flood_safe(
                 telegram_id,
                 formatted,
                 parse_mode=ParseMode.MARKDOWN_V2,
@@ -416,4 +800,4 @@ class Scheduler:
                 plain_message = f"{plain_marker}{type_label.strip()}\n\n{summary}\n\nОткрыть в @{channel}: https://t.me/{channel}/{post_id}"
             else:
                 plain_message = f"{plain_marker}{summary}\n\nОткрыть в @{channel}: https://t.me/{channel}/{post_id}"
-            await self.bot.send_message(telegram_id, plain_message)
+            await self._send_message_flood_safe(telegram_id, plain_message)
@@ -4,10 +4,13 @@
 Настройки хранятся в БД и кешируются в памяти для быстрого доступа.
 При изменении через API обновляется и БД, и кеш.
 """
+import asyncio
 import logging
 from datetime import datetime
+from types import MappingProxyType
 from typing import Any
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.db.database import get_async_session
 from app.db.models import AppSettings
@@ -15,40 +18,75 @@ from app.db.models import AppSettings
 logger = logging.getLogger(__name__)
 
 
-# Дефолтные настройки
-DEFAULT_SETTINGS = {
+# Дефолтные настройки: read-only прокси, чтобы fallback-путь
+# get_setting нельзя было случайно замутировать из вызывающего кода
+DEFAULT_SETTINGS: MappingProxyType[str, str] = MappingProxyType({
     "ai_provider": "gemini",  # gemini | claude
     "gemini_model": "gemma-3-27b-it",
     "claude_model": "haiku",
-}
+})
 
 # In-memory кеш настроек
 _settings_cache: dict[str, str] = {}
 _cache_loaded: bool = False
 
+# Лок только для первичной загрузки: два корутины, одновременно
+# попавшие в ensure_cache_loaded до выставления флага, не должны
+# дважды ходить в БД и перетирать кеш друг друга. Стационарные чтения
+# лок не берут
+_load_lock = asyncio.Lock()
+
+# Готовый dict AI-настроек (сбрасывается при изменении настроек)
+_ai_settings_cache: dict[str, Any] | None = None
+
+# Эпоха настроек: каждое изменение увеличивает счётчик, а читатели
+# горячего пути держат снимок (epoch, provider, model) и пересобирают
+# его только при несовпадении эпохи — одно чтение кортежа вместо
+# нескольких dict-лукапов на каждый LLM-запрос. Чтения кортежа атомарны
+# под GIL, лок не нужен
+_settings_epoch: int = 0
+_settings_view: tuple[int, str, str] | None = None
+
+
+def _rebuild_view() -> tuple[int, str, str]:
+    """Пересобирает снимок (epoch, provider, model) из кеша настроек"""
+    global _settings_view
+    provider = _settings_cache.get("ai_provider", "gemini")
+    if provider == "gemini":
+        model = _settings_cache.get("gemini_model", "gemma-3-27b-it")
+    else:
+        model = _settings_cache.get("claude_model", "haiku")
+    view = (_settings_epoch, provider, model)
+    _settings_view = view
+    return view
+
 
 async def load_settings_to_cache():
     """Загружает все настройки из БД в кеш (вызывается при старте)"""
     global _settings_cache, _cache_loaded
 
     async with get_async_session()() as session:
-        result = await session.execute(select(AppSettings))
-        db_settings = result.scalars().all()
+        # Core-select пары (key, value): без гидрации ORM-объектов,
+        # identity map и instrumentation ради двух колонок
+        result = await session.execute(select(AppSettings.key, AppSettings.value))
+        rows = result.all()
 
-        # Начинаем с дефолтов
-        _settings_cache = DEFAULT_SETTINGS.copy()
-
-        # Перезаписываем значениями из БД
-        for setting in db_settings:
-            _settings_cache[setting.key] = setting.value
+        # Дефолты, перекрытые значениями из БД
+        _settings_cache = dict(DEFAULT_SETTINGS) | dict(rows)
 
         _cache_loaded = True
-        logger.info(f"Loaded {len(db_settings)} settings from DB, {len(_settings_cache)} total in cache")
+        global _settings_epoch
+        _settings_epoch += 1
+        logger.info(f"Loaded {len(rows)} settings from DB, {len(_settings_cache)} total in cache")
 
 
 async def ensure_cache_loaded():
-    """Убеждается что кеш загружен"""
-    if not _cache_loaded:
+    """Убеждается что кеш загружен (double-checked locking)"""
+    if _cache_loaded:
+        return
+    async with _load_lock:
+        if _cache_loaded:
+            return
         await load_settings_to_cache()
 
 
@@ -73,28 +111,29 @@ async def get_setting_async(key: str, default: str | None = None) -> str | None:
 
 async def set_setting(key: str, value: str) -> None:
     """
-    Устанавливает настройку в БД и обновляет кеш.
+    Устанавливает настройку в БД одним upsert'ом и обновляет кеш.
     """
     global _settings_cache
 
+    now = datetime.utcnow()
     async with get_async_session()() as session:
-        # Ищем существующую настройку
-        result = await session.execute(
-            select(AppSettings).where(AppSettings.key == key)
+        # INSERT ... ON CONFLICT вместо SELECT + UPDATE/INSERT:
+        # один round-trip и нет гонки между читателем и писателем
+        await session.execute(
+            pg_insert(AppSettings)
+            .values(key=key, value=value, updated_at=now)
+            .on_conflict_do_update(
+                index_elements=["key"],
+                set_={"value": value, "updated_at": now},
+            )
         )
-        setting = result.scalar_one_or_none()
-
-        if setting:
-            setting.value = value
-            setting.updated_at = datetime.utcnow()
-        else:
-            setting = AppSettings(key=key, value=value)
-            session.add(setting)
-
         await session.commit()
 
-    # Обновляем кеш
+    # Обновляем кеш и инвалидируем снимки
+    global _ai_settings_cache, _settings_epoch
     _settings_cache[key] = value
+    _ai_settings_cache = None
+    _settings_epoch += 1
     logger.info(f"Setting updated: {key}={value[:50]}{'...' if len(value) > 50 else ''}")
 
 
@@ -105,26 +144,30 @@ async def get_all_settings() -> dict[str, Any]:
 
 
 async def get_ai_settings() -> dict[str, Any]:
-    """Возвращает настройки AI"""
+    """Возвращает настройки AI (dict кешируется до изменения настроек)"""
+    global _ai_settings_cache
     await ensure_cache_loaded()
-    return {
-        "provider": _settings_cache.get("ai_provider", "gemini"),
-        "gemini_model": _settings_cache.get("gemini_model", "gemma-3-27b-it"),
-        "claude_model": _settings_cache.get("claude_model", "haiku"),
-    }
+    if _ai_settings_cache is None:
+        _ai_settings_cache = {
+            "provider": _settings_cache.get("ai_provider", "gemini"),
+            "gemini_model": _settings_cache.get("gemini_model", "gemma-3-27b-it"),
+            "claude_model": _settings_cache.get("claude_model", "haiku"),
+        }
+    return _ai_settings_cache
 
 
 # Быстрый доступ к модели для Summarizer
 def get_current_model() -> str:
     """Возвращает текущую модель для суммаризации (синхронно)"""
-    provider = _settings_cache.get("ai_provider", "gemini")
-
-    if provider == "gemini":
-        return _settings_cache.get("gemini_model", "gemma-3-27b-it")
-    else:
-        return _settings_cache.get("claude_model", "haiku")
+    view = _settings_view
+    if view is None or view[0] != _settings_epoch:
+        view = _rebuild_view()
+    return view[2]
 
 
 def get_current_provider() -> str:
     """Возвращает текущий провайдер (gemini или claude)"""
-    return _settings_cache.get("ai_provider", "gemini")
+    view = _settings_view
+    if view is None or view[0] != _settings_epoch:
+        view = _rebuild_view()
+    return view[1]
@@ -1,20 +1,104 @@
 import google.generativeai as genai
+import hashlib
+import io
 import logging
 import os
 import asyncio
+import random
 import re
-import base64
+from collections import OrderedDict
 from typing import Optional
 
+from aiolimiter import AsyncLimiter
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
 from app.services.settings import get_current_model, get_setting
 
 logger = logging.getLogger(__name__)
 
+# Токен-бакет на ВСЕ вызовы Gemini процесса: и планировщик, и ручные
+# команды бота проходят через одно скользящее окно RPM, поэтому квота
+# не зависит от того, откуда пришёл запрос
+_llm_limiter = AsyncLimiter(
+    max_rate=float(os.getenv("GEMINI_RPM", "15")), time_period=60.0
+)
+
+# "retry in 30" / "seconds: 30" из текста ошибки Gemini — один
+# скомпилированный паттерн и один проход по строке
+_RETRY_RE = re.compile(r"(?:retry in|seconds:)\s*(\d+)", re.IGNORECASE)
+
+# Типизированные ошибки API, после которых имеет смысл подождать и
+# повторить — без сканирования текста исключения на каждый ретрай
+_RATE_LIMIT_EXC = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+)
+
+def _structured_retry_delay(error: Exception) -> float | None:
+    """Достаёт retry_delay из типизированной ошибки google.api_core"""
+    delay = getattr(error, "retry_delay", None)
+    if delay is None:
+        return None
+    total_seconds = getattr(delay, "total_seconds", None)
+    if callable(total_seconds):
+        return float(total_seconds()) + 5  # +5 секунд запас
+    seconds = getattr(delay, "seconds", None)
+    if seconds is not None:
+        return float(seconds) + 5
+    return None
+
+
+# Сконструированные модели по имени: переключение настроек туда-обратно
+# (A/B, канарейка) не пересоздаёт GenerativeModel каждый раз
+_MODEL_CACHE: dict[str, genai.GenerativeModel] = {}
+
+# Статические блоки промптов собираются один раз на импорт — при
+# каждом запросе интерполируются только динамические поля
+_POST_PROMPT_REQS = """Требования:
+- Резюме на русском языке
+- Выдели 2-3 ключевые мысли
+- Используй маркированный список для основных пунктов
+- Будь лаконичен (максимум 3-4 предложения)
+- Если есть цифры/даты/имена — сохрани их"""
+
+_MULTIMODAL_PROMPT_REQS = """Требования:
+- Резюме на русском языке
+- 2-3 ключевые мысли
+- Маркированный список для основных пунктов
+- Максимум 4-5 предложений
+- Сохрани важные цифры/даты/имена
+- НЕ начинай с "В посте..." или "Пост содержит..."
+"""
+
+# Телеграм отдаёт фото в 1500x2000+ — ужимаем перед отправкой в LLM:
+# меньше байт в аплоаде и меньше токенов на изображение
+MAX_IMAGE_SIDE = 1024
+JPEG_QUALITY = 85
+
+
+def _shrink_image(data: bytes) -> bytes:
+    """Ужимает изображение до MAX_IMAGE_SIDE по большей стороне (CPU, зовётся из потока)"""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            if max(im.size) <= MAX_IMAGE_SIDE and im.format == "JPEG":
+                return data
+            im.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+            out = io.BytesIO()
+            im.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning(f"Image shrink failed, sending original: {e}")
+        return data
+
 
 class Summarizer:
     """Сервис для создания резюме через Gemini"""
 
     MAX_RETRIES = 3
+    DESC_CACHE_MAX = 512
+    BACKOFF_CAP = 300.0
 
     def __init__(self):
         api_key = os.getenv("GEMINI_API_KEY", "")
@@ -24,6 +108,11 @@ class Summarizer:
         genai.configure(api_key=api_key)
         self._current_model_name: str | None = None
         self.model = None
+        # Описания изображений: LRU-кеш по отпечатку (картинка, контекст)
+        # и single-flight для совпавших по времени одинаковых запросов
+        # (форварды, дубли в альбомах)
+        self._desc_cache: OrderedDict[bytes, str] = OrderedDict()
+        self._desc_inflight: dict[bytes, asyncio.Future] = {}
         self._ensure_model()
 
     def _ensure_model(self):
@@ -32,93 +121,99 @@ class Summarizer:
 
         if model_name != self._current_model_name:
             logger.info(f"Switching to model: {model_name}")
-            self.model = genai.GenerativeModel(model_name)
+            model = _MODEL_CACHE.get(model_name)
+            if model is None:
+                model = _MODEL_CACHE.setdefault(model_name, genai.GenerativeModel(model_name))
+            self.model = model
             self._current_model_name = model_name
 
     def get_model_name(self) -> str:
         """Возвращает имя текущей модели"""
         return self._current_model_name or "unknown"
 
-    async def summarize(self, text: str, channel_name: str | None = None) -> tuple[str, dict]:
+    async def _call_with_retries(self, content, tag: str):
         """
-        Создаёт резюме текста с retry при rate limit.
+        Единственная точка вызова Gemini: ретраи на rate limit,
+        бэкофф и классификация ошибок живут здесь, а не в шести копиях
+        по методам.
 
-        Returns:
-            tuple: (summary_text, usage_stats)
+        Args:
+            content: Промпт (строка или список частей для multimodal)
+            tag: Метка для логов ([SUMMARIZE], [IMAGE], ...)
         """
         self._ensure_model()  # Проверяем актуальность модели
-        prompt = self._build_prompt(text, channel_name)
-
         for attempt in range(self.MAX_RETRIES):
             try:
-                response = self.model.generate_content(prompt)
-
-                # Статистика токенов
-                usage = response.usage_metadata
-                stats = {
-                    "input_tokens": usage.prompt_token_count,
-                    "output_tokens": usage.candidates_token_count,
-                    "total_tokens": usage.total_token_count,
-                }
-
-                logger.info(
-                    f"[TOKENS] Input: {stats['input_tokens']} | "
-                    f"Output: {stats['output_tokens']} | Total: {stats['total_tokens']}"
+                async with _llm_limiter:
+                    return await self.model.generate_content_async(content)
+            except _RATE_LIMIT_EXC as e:
+                wait_time = self._next_backoff(e, attempt)
+                logger.warning(
+                    f"[{tag}] Rate limit, waiting {wait_time:.0f}s before retry "
+                    f"(attempt {attempt + 1}/{self.MAX_RETRIES})"
                 )
-
-                return response.text, stats
-
+                await asyncio.sleep(wait_time)
             except Exception as e:
-                error_str = str(e)
+                # Другие ошибки — не ретраим
+                logger.error(f"[{tag}] Gemini API error (attempt {attempt + 1}): {e}")
+                raise
 
-                # ВСЕГДА логируем полную ошибку для диагностики
-                logger.error(f"Gemini API error (attempt {attempt + 1}): {error_str}")
+        # Все попытки исчерпаны
+        raise Exception(f"[{tag}] Failed after {self.MAX_RETRIES} retries due to rate limits")
+
+    async def summarize(self, text: str, channel_name: str | None = None) -> tuple[str, dict]:
+        """
+        Создаёт резюме текста с retry при rate limit.
 
-                # Проверяем на rate limit (429)
-                if "429" in error_str or "quota" in error_str.lower() or "resource" in error_str.lower():
-                    # Пытаемся извлечь время ожидания
-                    wait_time = self._extract_retry_delay(error_str)
-                    if wait_time is None:
-                        wait_time = (attempt + 1) * 60  # 60, 120, 180 сек
+        Returns:
+            tuple: (summary_text, usage_stats)
+        """
+        prompt = self._build_prompt(text, channel_name)
+        response = await self._call_with_retries(prompt, "SUMMARIZE")
 
-                    logger.warning(
-                        f"Rate limit detected, waiting {wait_time}s before retry "
-                        f"(attempt {attempt + 1}/{self.MAX_RETRIES})"
-                    )
-                    await asyncio.sleep(wait_time)
-                    continue
+        # Статистика токенов
+        usage = response.usage_metadata
+        stats = {
+            "input_tokens": usage.prompt_token_count,
+            "output_tokens": usage.candidates_token_count,
+            "total_tokens": usage.total_token_count,
+        }
 
-                # Другие ошибки — не ретраим
-                raise
+        logger.info(
+            f"[TOKENS] Input: {stats['input_tokens']} | "
+            f"Output: {stats['output_tokens']} | Total: {stats['total_tokens']}"
+        )
 
-        # Все попытки исчерпаны
-        raise Exception(f"Failed after {self.MAX_RETRIES} retries due to rate limits")
+        return response.text, stats
 
     def _extract_retry_delay(self, error_str: str) -> int | None:
-        """Извлекает время ожидания из ошибки"""
-        # Ищем "retry in X.XXs" или "seconds: X"
-        match = re.search(r'retry in (\d+)', error_str, re.IGNORECASE)
+        """Извлекает время ожидания из ошибки ("retry in X" или "seconds: X")"""
+        match = _RETRY_RE.search(error_str)
         if match:
             return int(match.group(1)) + 5  # +5 секунд запас
-
-        match = re.search(r'seconds:\s*(\d+)', error_str)
-        if match:
-            return int(match.group(1)) + 5
-
         return None
 
+    def _next_backoff(self, error: Exception, attempt: int) -> float:
+        """
+        Пауза перед ретраем: сначала structured retry_delay из ответа
+        API, потом текст ошибки, иначе джиттер в растущем окне — чтобы
+        параллельные задачи не просыпались синхронной волной и не били
+        в лимит повторно.
+        """
+        wait = _structured_retry_delay(error)
+        if wait is None:
+            wait = self._extract_retry_delay(str(error))
+        if wait is None:
+            wait = random.uniform(1.0, 60.0 * (2 ** attempt))
+        return min(float(wait), self.BACKOFF_CAP)
+
     def _build_prompt(self, text: str, channel_name: str | None = None) -> str:
         """Строит промпт для резюме"""
         channel_context = f" из канала @{channel_name}" if channel_name else ""
 
         return f"""Сделай краткое и информативное резюме следующего поста{channel_context}.
 
-Требования:
-- Резюме на русском языке
-- Выдели 2-3 ключевые мысли
-- Используй маркированный список для основных пунктов
-- Будь лаконичен (максимум 3-4 предложения)
-- Если есть цифры/даты/имена — сохрани их
+{_POST_PROMPT_REQS}
 
 Текст поста:
 {text}"""
@@ -130,10 +225,10 @@ class Summarizer:
         if not posts:
             return "Нет новых постов для резюме."
 
-        combined_text = "\n\n---\n\n".join([
+        combined_text = "\n\n---\n\n".join(
             f"Пост {i+1} (@{p.get('channel', 'unknown')}):\n{p.get('content', '')}"
             for i, p in enumerate(posts)
-        ])
+        )
 
         prompt = f"""Создай краткий дайджест из следующих постов.
 
@@ -146,36 +241,23 @@ class Summarizer:
 Посты:
 {combined_text}"""
 
-        self._ensure_model()
-
-        for attempt in range(self.MAX_RETRIES):
-            try:
-                response = self.model.generate_content(prompt)
-
-                usage = response.usage_metadata
-                logger.info(
-                    f"[BATCH TOKENS] Input: {usage.prompt_token_count} | "
-                    f"Output: {usage.candidates_token_count}"
-                )
-
-                return response.text
+        response = await self._call_with_retries(prompt, "BATCH")
 
-            except Exception as e:
-                error_str = str(e)
-                if "429" in error_str or "quota" in error_str.lower():
-                    wait_time = self._extract_retry_delay(error_str) or (attempt + 1) * 60
-                    logger.warning(f"Rate limit hit, waiting {wait_time}s")
-                    await asyncio.sleep(wait_time)
-                    continue
-
-                logger.error(f"Batch summarization error: {e}")
-                raise
+        usage = response.usage_metadata
+        logger.info(
+            f"[BATCH TOKENS] Input: {usage.prompt_token_count} | "
+            f"Output: {usage.candidates_token_count}"
+        )
 
-        raise Exception(f"Batch failed after {self.MAX_RETRIES} retries")
+        return response.text
 
     async def describe_image(self, image_data: bytes, context: str = "") -> str:
         """
-        Описывает изображение с помощью Gemma Vision.
+        Описывает изображение (кеш + single-flight по отпечатку).
+
+        Одинаковая картинка с одинаковым контекстом описывается один
+        раз: параллельные вызовы ждут общий future, повторные берут
+        готовый результат из LRU-кеша.
 
         Args:
             image_data: Байты изображения (JPEG/PNG)
@@ -184,16 +266,38 @@ class Summarizer:
         Returns:
             Описание изображения
         """
-        # Определяем MIME-тип
-        if image_data[:8] == b'\x89PNG\r\n\x1a\n':
-            mime_type = "image/png"
-        elif image_data[:2] == b'\xff\xd8':
-            mime_type = "image/jpeg"
-        else:
-            mime_type = "image/jpeg"  # По умолчанию
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(image_data)
+        fingerprint.update(context.encode())
+        key = fingerprint.digest()
+
+        cached = self._desc_cache.get(key)
+        if cached is not None:
+            self._desc_cache.move_to_end(key)
+            return cached
+
+        inflight = self._desc_inflight.get(key)
+        if inflight is not None:
+            return await inflight
+
+        task = asyncio.ensure_future(self._describe_image_uncached(image_data, context))
+        self._desc_inflight[key] = task
+        try:
+            description = await task
+        finally:
+            self._desc_inflight.pop(key, None)
+
+        self._desc_cache[key] = description
+        while len(self._desc_cache) > self.DESC_CACHE_MAX:
+            self._desc_cache.popitem(last=False)
+        return description
+
+    async def _describe_image_uncached(self, image_data: bytes, context: str = "") -> str:
+        """Поход в Gemini за описанием изображения (без кеша)"""
+        # Ужимаем в потоке — resize не блокирует event loop
+        image_data = await asyncio.to_thread(_shrink_image, image_data)
 
-        # Кодируем в base64
-        image_b64 = base64.b64encode(image_data).decode("utf-8")
+        mime_type = self._detect_mime(image_data)
 
         context_part = f"\n\nКонтекст поста: {context}" if context else ""
 
@@ -205,55 +309,46 @@ class Summarizer:
 - Только важные детали (люди, текст, объекты)
 - Если есть текст на изображении — процитируй его"""
 
+        # Сырые bytes в blob: SDK упакует их сам, без нашего
+        # base64-прохода и промежуточной str-копии картинки
+        content = [prompt, {"mime_type": mime_type, "data": image_data}]
+
         for attempt in range(self.MAX_RETRIES):
-            try:
-                response = self.model.generate_content([
-                    prompt,
-                    {
-                        "mime_type": mime_type,
-                        "data": image_b64
-                    }
-                ])
-
-                usage = response.usage_metadata
-                logger.info(
-                    f"[IMAGE TOKENS] Input: {usage.prompt_token_count} | "
-                    f"Output: {usage.candidates_token_count}"
-                )
+            response = await self._call_with_retries(content, "IMAGE")
 
-                # Проверяем что ответ не пустой
-                try:
-                    result_text = response.text if response.text else ""
-                except ValueError as ve:
-                    # response.text может выбросить исключение если заблокирован
-                    logger.warning(f"Cannot access response.text: {ve}")
-                    result_text = ""
-
-                if not result_text.strip():
-                    logger.warning(f"Empty response from model for image, attempt {attempt + 1}")
-                    # Логируем причину
-                    if hasattr(response, 'prompt_feedback'):
-                        logger.warning(f"Prompt feedback: {response.prompt_feedback}")
-                    if attempt < self.MAX_RETRIES - 1:
-                        await asyncio.sleep(2)
-                        continue
-                    return "Изображение (описание недоступно)"
+            usage = response.usage_metadata
+            logger.info(
+                f"[IMAGE TOKENS] Input: {usage.prompt_token_count} | "
+                f"Output: {usage.candidates_token_count}"
+            )
 
-                return result_text
+            # Проверяем что ответ не пустой
+            try:
+                result_text = response.text if response.text else ""
+            except ValueError as ve:
+                # response.text может выбросить исключение если заблокирован
+                logger.warning(f"Cannot access response.text: {ve}")
+                result_text = ""
 
-            except Exception as e:
-                error_str = str(e)
-                logger.error(f"Image description error (attempt {attempt + 1}): {error_str}")
+            if result_text.strip():
+                return result_text
 
-                if "429" in error_str or "quota" in error_str.lower() or "resource" in error_str.lower():
-                    wait_time = self._extract_retry_delay(error_str) or (attempt + 1) * 60
-                    logger.warning(f"Rate limit hit, waiting {wait_time}s")
-                    await asyncio.sleep(wait_time)
-                    continue
+            logger.warning(f"Empty response from model for image, attempt {attempt + 1}")
+            # Логируем причину
+            if hasattr(response, 'prompt_feedback'):
+                logger.warning(f"Prompt feedback: {response.prompt_feedback}")
+            if attempt < self.MAX_RETRIES - 1:
+                await asyncio.sleep(2)
 
-                raise
+        return "Изображение (описание недоступно)"
 
-        raise Exception(f"Image description failed after {self.MAX_RETRIES} retries")
+    @staticmethod
+    def _detect_mime(image_data: bytes) -> str:
+        """Определяет MIME-тип изображения по сигнатуре файла"""
+        # startswith смотрит в буфер напрямую, без слайс-копий
+        if image_data.startswith(b'\x89PNG\r\n\x1a\n'):
+            return "image/png"
+        return "image/jpeg"  # JPEG (\xff\xd8) и всё остальное
 
     async def describe_images(self, images: list[bytes], context: str = "") -> str:
         """
@@ -272,58 +367,24 @@ class Summarizer:
         if len(images) == 1:
             return await self.describe_image(images[0], context)
 
-        # Для нескольких изображений - описываем все сразу
-        image_parts = []
-        for img_data in images[:10]:  # Максимум 10 изображений
-            if img_data[:8] == b'\x89PNG\r\n\x1a\n':
-                mime_type = "image/png"
-            elif img_data[:2] == b'\xff\xd8':
-                mime_type = "image/jpeg"
+        # Каждое фото — отдельный параллельный запрос: альбом
+        # описывается за время одного round trip, один гигантский
+        # мультимодальный промпт не раздувает входной контекст, а сбой
+        # по одному фото не роняет весь альбом
+        descriptions = await asyncio.gather(
+            *(self.describe_image(img, context) for img in images[:10]),
+            return_exceptions=True,
+        )
+
+        lines = []
+        for i, desc in enumerate(descriptions, start=1):
+            if isinstance(desc, BaseException):
+                logger.error(f"Album image {i} description failed: {desc}")
+                lines.append(f"Фото {i}: (не удалось описать)")
             else:
-                mime_type = "image/jpeg"
-
-            image_parts.append({
-                "mime_type": mime_type,
-                "data": base64.b64encode(img_data).decode("utf-8")
-            })
+                lines.append(f"Фото {i}: {desc}")
 
-        context_part = f"\n\nКонтекст поста: {context}" if context else ""
-
-        prompt = f"""Опиши этот альбом из {len(images)} изображений.{context_part}
-
-Требования:
-- На русском языке
-- 1-2 предложения на каждое изображение
-- Общая тема альбома если есть
-- Важные детали и текст на изображениях"""
-
-        for attempt in range(self.MAX_RETRIES):
-            try:
-                # Собираем запрос: промпт + все изображения
-                content = [prompt] + image_parts
-                response = self.model.generate_content(content)
-
-                usage = response.usage_metadata
-                logger.info(
-                    f"[ALBUM TOKENS] Input: {usage.prompt_token_count} | "
-                    f"Output: {usage.candidates_token_count}"
-                )
-
-                return response.text
-
-            except Exception as e:
-                error_str = str(e)
-                logger.error(f"Album description error (attempt {attempt + 1}): {error_str}")
-
-                if "429" in error_str or "quota" in error_str.lower() or "resource" in error_str.lower():
-                    wait_time = self._extract_retry_delay(error_str) or (attempt + 1) * 60
-                    logger.warning(f"Rate limit hit, waiting {wait_time}s")
-                    await asyncio.sleep(wait_time)
-                    continue
-
-                raise
-
-        raise Exception(f"Album description failed after {self.MAX_RETRIES} retries")
+        return "\n".join(lines)
 
     async def summarize_multimodal(
         self,
@@ -363,7 +424,6 @@ class Summarizer:
             try:
                 image_desc = await self.describe_images(images, context=text)
                 parts.append(f"Изображения ({len(images)} шт):\n{image_desc}")
-                await asyncio.sleep(5)  # Rate limit для Gemini
             except Exception as e:
                 logger.error(f"Failed to describe images: {e}")
                 parts.append(f"Изображения: {len(images)} шт (не удалось описать)")
@@ -398,71 +458,49 @@ class Summarizer:
 
 {combined_content}
 
-Требования:
-- Резюме на русском языке
-- 2-3 ключевые мысли
-- Маркированный список для основных пунктов
-- Максимум 4-5 предложений
-- Сохрани важные цифры/даты/имена
-- НЕ начинай с "В посте..." или "Пост содержит..."
-"""
+{_MULTIMODAL_PROMPT_REQS}"""
 
         for attempt in range(self.MAX_RETRIES):
-            try:
-                response = self.model.generate_content(prompt)
-
-                usage = response.usage_metadata
-                stats = {
-                    "input_tokens": usage.prompt_token_count,
-                    "output_tokens": usage.candidates_token_count,
-                    "total_tokens": usage.total_token_count,
-                }
-
-                logger.info(
-                    f"[MULTIMODAL TOKENS] Input: {stats['input_tokens']} | "
-                    f"Output: {stats['output_tokens']}"
-                )
+            response = await self._call_with_retries(prompt, "MULTIMODAL")
 
-                # Проверяем что ответ не пустой
-                result_text = response.text if response.text else ""
-                if not result_text.strip():
-                    logger.warning(f"Empty response from model, attempt {attempt + 1}")
-                    # Проверяем причину блокировки
-                    if response.candidates:
-                        for candidate in response.candidates:
-                            if candidate.finish_reason:
-                                logger.warning(f"Finish reason: {candidate.finish_reason}")
-                            if hasattr(candidate, 'safety_ratings'):
-                                logger.warning(f"Safety ratings: {candidate.safety_ratings}")
-                    if attempt < self.MAX_RETRIES - 1:
-                        await asyncio.sleep(2)
-                        continue
-                    # Fallback - возвращаем краткое описание контента
-                    fallback = "Контент обработан"
-                    if type_label:
-                        fallback = f"[{type_label}]\n\n{fallback}"
-                    return fallback, stats
+            usage = response.usage_metadata
+            stats = {
+                "input_tokens": usage.prompt_token_count,
+                "output_tokens": usage.candidates_token_count,
+                "total_tokens": usage.total_token_count,
+            }
+
+            logger.info(
+                f"[MULTIMODAL TOKENS] Input: {stats['input_tokens']} | "
+                f"Output: {stats['output_tokens']}"
+            )
 
+            # Проверяем что ответ не пустой
+            result_text = response.text if response.text else ""
+            if result_text.strip():
                 # Добавляем маркер типов в начало если есть
                 summary = result_text
                 if type_label:
                     summary = f"[{type_label}]\n\n{summary}"
-
                 return summary, stats
 
-            except Exception as e:
-                error_str = str(e)
-                logger.error(f"Multimodal summarize error (attempt {attempt + 1}): {error_str}")
-
-                if "429" in error_str or "quota" in error_str.lower() or "resource" in error_str.lower():
-                    wait_time = self._extract_retry_delay(error_str) or (attempt + 1) * 60
-                    logger.warning(f"Rate limit hit, waiting {wait_time}s")
-                    await asyncio.sleep(wait_time)
-                    continue
-
-                raise
-
-        raise Exception(f"Multimodal summarize failed after {self.MAX_RETRIES} retries")
+            logger.warning(f"Empty response from model, attempt {attempt + 1}")
+            # Проверяем причину блокировки
+            if response.candidates:
+                for candidate in response.candidates:
+                    if candidate.finish_reason:
+                        logger.warning(f"Finish reason: {candidate.finish_reason}")
+                    if hasattr(candidate, 'safety_ratings'):
+                        logger.warning(f"Safety ratings: {candidate.safety_ratings}")
+            if attempt < self.MAX_RETRIES - 1:
+                await asyncio.sleep(2)
+                continue
+
+            # Fallback - возвращаем краткое описание контента
+            fallback = "Контент обработан"
+            if type_label:
+                fallback = f"[{type_label}]\n\n{fallback}"
+            return fallback, stats
 
     async def check_interests(self, summary: str, interests: str) -> bool:
         """
@@ -490,7 +528,7 @@ class Summarizer:
 - НЕТ — если пост не связан или связь слабая"""
 
         try:
-            response = self.model.generate_content(prompt)
+            response = await self._call_with_retries(prompt, "INTERESTS")
 
             usage = response.usage_metadata
             logger.debug(
@@ -510,3 +548,132 @@ class Summarizer:
         except Exception as e:
             logger.error(f"Interest check error: {e}")
             return False  # При ошибке не помечаем как важное
+
+    async def check_interests_batch(self, summary: str, interests_list: list[str]) -> list[bool]:
+        """
+        Проверяет резюме сразу против нескольких профилей интересов.
+
+        Один запрос к Gemini на пост вместо запроса на каждого подписчика.
+
+        Args:
+            summary: Резюме поста
+            interests_list: Профили интересов (по одному на подписчика)
+
+        Returns:
+            Список bool в порядке interests_list
+        """
+        if not summary or not interests_list:
+            return [False] * len(interests_list)
+
+        if len(interests_list) == 1:
+            return [await self.check_interests(summary, interests_list[0])]
+
+        numbered = "\n".join(
+            f"{i + 1}. {interests}" for i, interests in enumerate(interests_list)
+        )
+
+        prompt = f"""Определи для каждого профиля, соответствует ли пост его интересам.
+
+Профили интересов:
+{numbered}
+
+Содержание поста:
+{summary}
+
+Ответь ТОЛЬКО строкой из {len(interests_list)} цифр через запятую, по одной на профиль по порядку:
+1 — пост явно связан с интересами профиля
+0 — не связан или связь слабая
+Пример ответа для трёх профилей: 1,0,1"""
+
+        try:
+            response = await self._call_with_retries(prompt, "INTERESTS BATCH")
+
+            usage = response.usage_metadata
+            logger.debug(
+                f"[INTERESTS BATCH] Input: {usage.prompt_token_count} | "
+                f"Output: {usage.candidates_token_count}"
+            )
+
+            raw = response.text.strip() if response.text else ""
+            digits = re.findall(r"[01]", raw)
+            matches = [d == "1" for d in digits[:len(interests_list)]]
+            # Неполный ответ добиваем безопасным дефолтом «не интересно»
+            matches += [False] * (len(interests_list) - len(matches))
+
+            logger.info(f"[INTERESTS] Batch of {len(interests_list)}: {raw[:40]}")
+
+            return matches
+
+        except Exception as e:
+            logger.error(f"Batch interest check error: {e}")
+            return [False] * len(interests_list)
+
+    async def check_interests_posts(self, summaries: list[str], interests: str) -> list[bool]:
+        """
+        Проверяет один профиль интересов сразу против пачки постов.
+
+        Транспонированный вариант check_interests_batch: один запрос
+        к Gemini на профиль вместо запроса на каждый пост цикла.
+
+        Args:
+            summaries: Резюме постов
+            interests: Описание интересов пользователя
+
+        Returns:
+            Список bool в порядке summaries
+        """
+        if not interests or not summaries:
+            return [False] * len(summaries)
+
+        if len(summaries) == 1:
+            return [await self.check_interests(summaries[0], interests)]
+
+        numbered = "\n\n".join(
+            f"Пост {i + 1}:\n{summary}" for i, summary in enumerate(summaries)
+        )
+
+        prompt = f"""Определи для каждого поста, соответствует ли он интересам пользователя.
+
+Интересы пользователя: {interests}
+
+Посты:
+{numbered}
+
+Ответь ТОЛЬКО строкой из {len(summaries)} цифр через запятую, по одной на пост по порядку:
+1 — пост явно связан с интересами пользователя
+0 — не связан или связь слабая
+Пример ответа для трёх постов: 1,0,1"""
+
+        try:
+            response = await self._call_with_retries(prompt, "INTERESTS POSTS")
+
+            usage = response.usage_metadata
+            logger.debug(
+                f"[INTERESTS POSTS] Input: {usage.prompt_token_count} | "
+                f"Output: {usage.candidates_token_count}"
+            )
+
+            raw = response.text.strip() if response.text else ""
+            digits = re.findall(r"[01]", raw)
+            matches = [d == "1" for d in digits[:len(summaries)]]
+            # Неполный ответ добиваем безопасным дефолтом «не интересно»
+            matches += [False] * (len(summaries) - len(matches))
+
+            logger.info(f"[INTERESTS] Posts batch of {len(summaries)}: {raw[:40]}")
+
+            return matches
+
+        except Exception as e:
+            logger.error(f"Posts interest check error: {e}")
+            return [False] * len(summaries)
+
+
+# Ленивая инициализация
+_summarizer = None
+
+
+def get_summarizer() -> Summarizer:
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = Summarizer()
+    return _summarizer
@@ -1,24 +1,228 @@
+import array
+import asyncio
+import hashlib
+import io
 import logging
 import os
-import tempfile
+from collections import OrderedDict
 from pathlib import Path
 
-from openai import OpenAI
+import httpx
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
 
+def schedule_client_close(client: AsyncOpenAI) -> None:
+    """
+    Планирует закрытие клиента в текущем event loop.
+
+    Отдельная функция (не метод), чтобы weakref.finalize мог держать
+    ссылку только на клиент, не продлевая жизнь самому сервису.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Цикла уже нет — соединения закроет сборщик мусора
+        return
+    loop.create_task(client.close())
+
+
 class TranscriptionService:
     """Сервис для транскрипции аудио/видео через Whisper"""
 
     SUPPORTED_FORMATS = ['.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm', '.ogg', '.oga']
 
+    # Мелкие файлы (голосовые и так OGG-Opus) не пережимаем —
+    # накладные расходы на ffmpeg превысят экономию трафика
+    COMPRESS_MIN_BYTES = 64 * 1024
+
+    # Детектор тишины: случайно зажатая кнопка записи не должна
+    # стоить запроса к Whisper. Смотрим первые секунды записи и
+    # если почти нет фреймов с речевой энергией — возвращаем ""
+    VAD_ENABLED = os.getenv("TRANSCRIBE_VAD", "1") == "1"
+    VAD_CHECK_SECONDS = 5
+    VAD_FRAME_MS = 30
+    VAD_RMS_THRESHOLD = 300  # энергия int16-сэмплов, ниже — тишина
+    VAD_MIN_SPEECH_RATIO = 0.1
+
+    # Одно и то же голосовое/видео пересылают по разным чатам —
+    # повторную транскрипцию берём из кеша по хешу байтов
+    CACHE_MAX = 256
+
+    # Лимит Whisper на размер файла — склейку больше него не шлём
+    MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+    # Сигнатуры контейнеров: когда расширение врёт или отсутствует,
+    # формат определяем по первым байтам, а не после отказа API
+    _MAGIC_SUFFIXES = (
+        (b"OggS", ".ogg"),
+        (b"ID3", ".mp3"),
+        (b"RIFF", ".wav"),
+        (b"\x1aE\xdf\xa3", ".webm"),
+    )
+
     def __init__(self):
         api_key = os.getenv("OPENAI_API_KEY", "")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not set")
 
-        self.client = OpenAI(api_key=api_key)
+        # Async-клиент: аплоад и ожидание Whisper не блокируют event
+        # loop, параллельные транскрипции реально перекрываются.
+        # Явный httpx-пул с keep-alive: TCP+TLS-рукопожатия
+        # амортизируются между транскрипциями, как в ChannelParser
+        self._http = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+        # SDK сам ретраит 429/5xx с экспоненциальным jitter-бэкоффом
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=self._http,
+            max_retries=int(os.getenv("WHISPER_MAX_RETRIES", "4")),
+        )
+        # Самоограничение до того, как ограничит API: семафор держит
+        # число одновременных аплоадов, токен-бакет — скользящее окно
+        # RPM. Всплеск голосовых от userbot не превращается в шторм 429
+        self._sem = asyncio.Semaphore(int(os.getenv("WHISPER_CONCURRENCY", "4")))
+        self._limiter = AsyncLimiter(
+            max_rate=float(os.getenv("WHISPER_RPM", "50")), time_period=60.0
+        )
+        # LRU готовых транскрипций: ключ (sha256 аудио, язык)
+        self._cache: OrderedDict[tuple[bytes, str], str] = OrderedDict()
+
+    async def aclose(self):
+        """Закрывает HTTP-клиент OpenAI (и его httpx-пул)"""
+        try:
+            await self.client.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Планирует закрытие HTTP-клиента OpenAI в текущем цикле"""
+        schedule_client_close(self.client)
+
+    @staticmethod
+    async def _compress(src: bytes | Path) -> bytes | None:
+        """
+        Перегоняет аудиодорожку в 16 кГц моно Opus через ffmpeg.
+
+        Whisper'у не нужны видеодорожка и частота выше 16 кГц —
+        многомегабайтное видео ужимается до десятков КБ на минуту,
+        а выигрыш аплоада пропорционален убранным байтам.
+
+        Returns:
+            Сжатые байты или None, если ffmpeg недоступен/не справился
+            (тогда зальём оригинал)
+        """
+        input_arg = "pipe:0" if isinstance(src, bytes) else str(src)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-i", input_arg,
+                "-vn", "-ac", "1", "-ar", "16000",
+                "-c:a", "libopus", "-b:a", "24k",
+                "-f", "ogg", "pipe:1",
+                stdin=asyncio.subprocess.PIPE if isinstance(src, bytes) else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logger.warning("ffmpeg not found, uploading original audio")
+            return None
+        out, _ = await proc.communicate(src if isinstance(src, bytes) else None)
+        if proc.returncode != 0 or not out:
+            logger.warning("ffmpeg transcode failed, uploading original audio")
+            return None
+        return out
+
+    @classmethod
+    async def _speech_ratio(cls, src: bytes | Path) -> float | None:
+        """
+        Доля фреймов с речевой энергией в начале записи.
+
+        Декодирует первые VAD_CHECK_SECONDS в 16-битный PCM через
+        ffmpeg и считает RMS по 30мс-фреймам — микросекунды CPU
+        против секунд аплоада и инференса.
+
+        Returns:
+            Доля «звучащих» фреймов или None, если декодировать
+            не удалось (тогда решение не принимаем)
+        """
+        input_arg = "pipe:0" if isinstance(src, bytes) else str(src)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-hide_banner", "-loglevel", "error",
+                "-t", str(cls.VAD_CHECK_SECONDS),
+                "-i", input_arg,
+                "-vn", "-ac", "1", "-ar", "16000",
+                "-f", "s16le", "pipe:1",
+                stdin=asyncio.subprocess.PIPE if isinstance(src, bytes) else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            return None
+        pcm, _ = await proc.communicate(src if isinstance(src, bytes) else None)
+        if proc.returncode != 0 or not pcm:
+            return None
+
+        frame_bytes = int(16000 * cls.VAD_FRAME_MS / 1000) * 2
+        if len(pcm) < frame_bytes:
+            return None
+        threshold_sq = cls.VAD_RMS_THRESHOLD ** 2
+        voiced = total = 0
+        for i in range(0, len(pcm) - frame_bytes + 1, frame_bytes):
+            samples = array.array("h", pcm[i:i + frame_bytes])
+            energy = sum(s * s for s in samples) / len(samples)
+            total += 1
+            if energy > threshold_sq:
+                voiced += 1
+        return voiced / total if total else None
+
+    @classmethod
+    def _sniff_suffix(cls, head: bytes) -> str | None:
+        """Определяет расширение контейнера по magic-байтам"""
+        for magic, suffix in cls._MAGIC_SUFFIXES:
+            if head.startswith(magic):
+                return suffix
+        if len(head) >= 12 and head[4:8] == b"ftyp":
+            return ".mp4"
+        return None
+
+    def _cache_get(self, key: tuple[bytes, str]) -> str | None:
+        """Возвращает транскрипцию из LRU-кеша (с обновлением свежести)"""
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+        return cached
+
+    def _cache_put(self, key: tuple[bytes, str], text: str) -> None:
+        """Кладёт транскрипцию в кеш, вытесняя самую давнюю запись"""
+        self._cache[key] = text
+        while len(self._cache) > self.CACHE_MAX:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _hash_file(path: Path) -> bytes:
+        """SHA-256 файла почанково (зовётся из потока, диск не в event loop)"""
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.digest()
+
+    async def _is_silent(self, src: bytes | Path) -> bool:
+        """True если запись почти целиком тишина и Whisper можно не звать"""
+        if not self.VAD_ENABLED:
+            return False
+        ratio = await self._speech_ratio(src)
+        if ratio is not None and ratio < self.VAD_MIN_SPEECH_RATIO:
+            logger.info(f"Skipping transcription: speech ratio {ratio:.0%}")
+            return True
+        return False
 
     async def transcribe(self, file_path: str | Path, language: str = "ru") -> str:
         """
@@ -36,29 +240,261 @@ class TranscriptionService:
         if not file_path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        # Проверяем формат
-        suffix = file_path.suffix.lower()
+        key = (await asyncio.to_thread(self._hash_file, file_path), language)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info(f"Transcription cache hit: {file_path.name}")
+            return cached
+
+        if await self._is_silent(file_path):
+            self._cache_put(key, "")
+            return ""
+
+        # Крупные файлы (видео, кружки, пересланное аудио) сначала
+        # ужимаем: из файла ffmpeg читает сам, без копии в память
+        if file_path.stat().st_size >= self.COMPRESS_MIN_BYTES:
+            compressed = await self._compress(file_path)
+            if compressed is not None:
+                logger.info(
+                    f"Audio compressed: {file_path.stat().st_size} -> {len(compressed)} bytes"
+                )
+                transcript = await self._upload(
+                    io.BytesIO(compressed), "audio.ogg", language
+                )
+                self._cache_put(key, transcript)
+                return transcript
+
+        # Тонкая обёртка над _upload: SDK читает файл сам,
+        # без промежуточной копии в память
+        with open(file_path, "rb") as audio_file:
+            transcript = await self._upload(audio_file, file_path.name, language)
+        self._cache_put(key, transcript)
+        return transcript
+
+    async def transcribe_stream(self, fileobj, filename: str = "audio.ogg", language: str = "ru") -> str:
+        """
+        Транскрибирует аудио из file-like объекта (BytesIO, открытый файл).
+
+        Именно сюда приходят хендлеры бота с буферами из download_media,
+        поэтому пережатие больших записей живёт здесь, а не только в
+        файловом пути transcribe().
+
+        Args:
+            fileobj: File-like объект с аудио
+            filename: Имя файла (для определения формата)
+            language: Язык
+
+        Returns:
+            Текст транскрипции
+        """
+        fileobj.seek(0)
+        data = fileobj.read()
+        key = (hashlib.sha256(data).digest(), language)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info(f"Transcription cache hit: {filename}")
+            return cached
+        if await self._is_silent(data):
+            self._cache_put(key, "")
+            return ""
+        transcript = await self._compress_and_upload(data, filename, language)
+        self._cache_put(key, transcript)
+        return transcript
+
+    async def _compress_and_upload(self, data: bytes, filename: str, language: str) -> str:
+        """Пережимает крупную запись в Opus (если выгодно) и заливает"""
+        if len(data) >= self.COMPRESS_MIN_BYTES:
+            compressed = await self._compress(data)
+            if compressed is not None and len(compressed) < len(data):
+                logger.info(f"Audio compressed: {len(data)} -> {len(compressed)} bytes")
+                data, filename = compressed, "audio.ogg"
+        return await self._upload(io.BytesIO(data), filename, language)
+
+    async def _upload(self, fileobj, filename: str, language: str) -> str:
+        """
+        Заливает file-like объект в Whisper как есть (без пережатия).
+
+        SDK читает объект напрямую — без промежуточного временного файла
+        и без копирования данных в bytes.
+        """
+        # Локальные пре-чеки до сетевого похода: превышение лимита
+        # Whisper отклоняем сами, не заливая 25+ МБ ради отказа API
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        if size > self.MAX_UPLOAD_BYTES:
+            raise ValueError(
+                f"Audio exceeds Whisper {self.MAX_UPLOAD_BYTES // (1024 * 1024)}MB "
+                f"limit: {size} bytes ({filename})"
+            )
+
+        suffix = Path(filename).suffix.lower()
         if suffix not in self.SUPPORTED_FORMATS:
-            logger.warning(f"Unsupported format {suffix}, trying anyway...")
+            sniffed = self._sniff_suffix(fileobj.read(12))
+            fileobj.seek(0)
+            if sniffed:
+                filename = Path(filename).stem + sniffed
+                logger.info(f"Detected container {sniffed} by magic bytes for {suffix or 'no ext'}")
+            else:
+                logger.warning(f"Unsupported format {suffix}, trying anyway...")
 
         try:
-            with open(file_path, "rb") as audio_file:
-                logger.info(f"Transcribing file: {file_path.name}")
-
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language=language,
-                    response_format="text"
-                )
+            fileobj.seek(0)
+            logger.info(f"Transcribing stream: {filename}")
 
-                logger.info(f"Transcription completed: {len(transcript)} chars")
-                return transcript
+            async with self._sem:
+                async with self._limiter:
+                    transcript = await self.client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=(filename, fileobj),
+                        language=language,
+                        response_format="text"
+                    )
+
+            logger.info(f"Transcription completed: {len(transcript)} chars")
+            return transcript
 
         except Exception as e:
             logger.error(f"Transcription error: {e}")
             raise
 
+    @staticmethod
+    async def _duration(path: Path) -> float | None:
+        """Длительность файла в секундах через ffprobe (None при ошибке)"""
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                str(path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            return None
+        out, _ = await proc.communicate()
+        try:
+            return float(out.strip())
+        except (ValueError, TypeError):
+            return None
+
+    async def _transcribe_concat(
+        self, paths: list[Path], durations: list[float], language: str
+    ) -> list[str] | None:
+        """
+        Склеивает клипы в один Opus-поток, транскрибирует одним
+        запросом с таймстемпами сегментов и раскладывает текст
+        обратно по клипам через накопленные смещения.
+
+        Returns:
+            Тексты в порядке paths или None, если склейка/разбор не
+            удались (вызывающий уходит на поклиповый путь)
+        """
+        n = len(paths)
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        for p in paths:
+            args += ["-i", str(p)]
+        filter_spec = "".join(f"[{i}:a]" for i in range(n)) + f"concat=n={n}:v=0:a=1[out]"
+        args += [
+            "-filter_complex", filter_spec, "-map", "[out]",
+            "-ac", "1", "-ar", "16000",
+            "-c:a", "libopus", "-b:a", "24k",
+            "-f", "ogg", "pipe:1",
+        ]
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            return None
+        out, _ = await proc.communicate()
+        if proc.returncode != 0 or not out or len(out) > self.MAX_UPLOAD_BYTES:
+            return None
+
+        try:
+            async with self._sem:
+                async with self._limiter:
+                    response = await self.client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=("batch.ogg", io.BytesIO(out)),
+                        language=language,
+                        response_format="verbose_json",
+                        timestamp_granularities=["segment"],
+                    )
+        except Exception as e:
+            logger.error(f"Batch transcription error: {e}")
+            return None
+
+        segments = getattr(response, "segments", None) or []
+        # Границы клипов в склейке — накопленные длительности
+        ends: list[float] = []
+        acc = 0.0
+        for d in durations:
+            acc += d
+            ends.append(acc)
+
+        texts = [""] * n
+        clip = 0
+        for seg in segments:
+            mid = (float(seg.start) + float(seg.end)) / 2
+            while clip < n - 1 and mid >= ends[clip]:
+                clip += 1
+            texts[clip] += seg.text
+        logger.info(f"Batch transcription: {n} clips, {len(segments)} segments")
+        return [t.strip() for t in texts]
+
+    async def transcribe_batch(self, paths: list[str | Path], language: str = "ru") -> list[str]:
+        """
+        Транскрибирует пачку коротких клипов одним запросом к Whisper.
+
+        Промахи кеша склеиваются ffmpeg'ом и уходят одним аплоадом —
+        фиксированные накладные расходы запроса амортизируются на все
+        клипы медиагруппы. При любой проблеме (нет ffmpeg, склейка
+        больше лимита) откатываемся на поклиповую транскрипцию.
+
+        Returns:
+            Тексты в порядке paths ("" для неудавшихся клипов)
+        """
+        path_objs = [Path(p) for p in paths]
+        keys = [
+            (digest, language)
+            for digest in await asyncio.gather(
+                *[asyncio.to_thread(self._hash_file, p) for p in path_objs]
+            )
+        ]
+        results: list[str | None] = [self._cache_get(k) for k in keys]
+        miss_idx = [i for i, r in enumerate(results) if r is None]
+        if not miss_idx:
+            return results
+
+        texts: list[str] | None = None
+        if len(miss_idx) > 1:
+            miss_paths = [path_objs[i] for i in miss_idx]
+            durations = await asyncio.gather(*[self._duration(p) for p in miss_paths])
+            if all(d is not None for d in durations):
+                texts = await self._transcribe_concat(miss_paths, durations, language)
+                if texts is not None:
+                    for i, text in zip(miss_idx, texts):
+                        results[i] = text
+                        self._cache_put(keys[i], text)
+
+        if texts is None:
+            # Поклиповый fallback: transcribe сам кеширует результат
+            fallback = await asyncio.gather(
+                *[self.transcribe(path_objs[i], language) for i in miss_idx],
+                return_exceptions=True,
+            )
+            for i, text in zip(miss_idx, fallback):
+                if isinstance(text, BaseException):
+                    logger.error(f"Transcription failed for {path_objs[i].name}: {text}")
+                    results[i] = ""
+                else:
+                    results[i] = text
+
+        return results
+
     async def transcribe_bytes(self, data: bytes, filename: str = "audio.ogg", language: str = "ru") -> str:
         """
         Транскрибирует аудио из байтов.
@@ -71,21 +507,7 @@ class TranscriptionService:
         Returns:
             Текст транскрипции
         """
-        # Создаём временный файл
-        suffix = Path(filename).suffix or ".ogg"
-
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-            tmp.write(data)
-            tmp_path = tmp.name
-
-        try:
-            return await self.transcribe(tmp_path, language)
-        finally:
-            # Удаляем временный файл
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        return await self.transcribe_stream(io.BytesIO(data), filename, language)
 
 
 # Ленивая инициализация
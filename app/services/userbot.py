@@ -8,7 +8,8 @@ import asyncio
 import logging
 import os
 import tempfile
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from enum import Enum
 from pathlib import Path
 from typing import Optional
@@ -23,13 +24,27 @@ from pyrogram.errors import (
     BadRequest,
     ChannelPrivate,
 )
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from app.db.database import get_async_session
 from app.db.models import UserbotSession, Channel
 
 logger = logging.getLogger(__name__)
 
+# Символы-разделители в номере/коде вырезаем одним проходом translate
+# вместо цепочки replace; набор легко расширять
+_PHONE_STRIP = str.maketrans({" ": None, "-": None, "(": None, ")": None, ".": None})
+
+
+def _utcnow() -> datetime:
+    """
+    Наивный UTC-timestamp для колонок БД.
+
+    datetime.utcnow() объявлен deprecated; колонки при этом хранят
+    наивное время, поэтому tzinfo срезаем
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 class AuthState(str, Enum):
     """Состояния авторизации userbot"""
@@ -50,6 +65,14 @@ class UserbotService:
     - Скачивать медиа (голосовые, кружки, видео)
     """
 
+    # Порог для скачивания в память: что крупнее — льём на диск,
+    # чтобы видео на десятки МБ не висело bytes-объектом
+    IN_MEMORY_LIMIT = 50 * 1024 * 1024
+
+    # last_used_at обновляем не чаще раза в минуту: горячий цикл
+    # опроса каналов не должен писать в БД на каждый get_client
+    LAST_USED_INTERVAL = 60.0
+
     def __init__(self):
         self.api_id = os.getenv("TELEGRAM_API_ID")
         self.api_hash = os.getenv("TELEGRAM_API_HASH")
@@ -57,6 +80,13 @@ class UserbotService:
         self._auth_state = AuthState.NOT_STARTED
         self._current_phone: Optional[str] = None
         self._phone_code_hash: Optional[str] = None
+        self._last_used_touch = 0.0
+        # Фоновые апдейты last_used_at: держим ссылки, чтобы
+        # event loop не собрал задачи до завершения
+        self._bg_tasks: set[asyncio.Task] = set()
+        # Восстановление клиента из сессии сериализуем: параллельные
+        # задачи планировщика не должны поднимать несколько клиентов
+        self._client_lock = asyncio.Lock()
 
         if not self.api_id or not self.api_hash:
             logger.warning(
@@ -83,6 +113,19 @@ class UserbotService:
                 "message": "TELEGRAM_API_ID и TELEGRAM_API_HASH не настроены",
             }
 
+        # Живой подключённый клиент — статус известен без похода в БД
+        if (
+            self._client
+            and self._client.is_connected
+            and self._auth_state == AuthState.AUTHORIZED
+        ):
+            return {
+                "configured": True,
+                "state": AuthState.AUTHORIZED,
+                "phone": self._current_phone,
+                "message": "Userbot авторизован и готов к работе",
+            }
+
         # Проверяем сохранённую сессию в БД
         async with get_async_session()() as session:
             result = await session.execute(
@@ -136,7 +179,7 @@ class UserbotService:
             }
 
         # Нормализуем номер телефона
-        phone_number = phone_number.strip().replace(" ", "").replace("-", "")
+        phone_number = phone_number.translate(_PHONE_STRIP).strip()
         if not phone_number.startswith("+"):
             phone_number = "+" + phone_number
 
@@ -224,7 +267,7 @@ class UserbotService:
                 "error": "Сессия авторизации не найдена. Начните заново.",
             }
 
-        code = code.strip().replace(" ", "").replace("-", "")
+        code = code.translate(_PHONE_STRIP).strip()
 
         try:
             # Пробуем войти с кодом
@@ -329,12 +372,13 @@ class UserbotService:
         session_string = await self._client.export_session_string()
 
         async with get_async_session()() as session:
-            # Деактивируем все старые сессии
-            result = await session.execute(
-                select(UserbotSession).where(UserbotSession.is_active == True)
+            # Деактивируем все старые сессии одним UPDATE, без загрузки
+            # строк в identity map и пообъектного flush
+            await session.execute(
+                update(UserbotSession)
+                .where(UserbotSession.is_active == True)
+                .values(is_active=False)
             )
-            for old_session in result.scalars().all():
-                old_session.is_active = False
 
             # Обновляем текущую сессию
             result = await session.execute(
@@ -348,7 +392,7 @@ class UserbotService:
                 db_session.session_string = session_string
                 db_session.is_authorized = True
                 db_session.is_active = True
-                db_session.last_used_at = datetime.utcnow()
+                db_session.last_used_at = _utcnow()
             else:
                 db_session = UserbotSession(
                     phone_number=self._current_phone,
@@ -374,8 +418,18 @@ class UserbotService:
 
         # Если клиент уже есть и подключён
         if self._client and self._client.is_connected:
+            self._touch_last_used()
             return self._client
 
+        async with self._client_lock:
+            # Пока ждали лок, клиент мог поднять кто-то другой
+            if self._client and self._client.is_connected:
+                self._touch_last_used()
+                return self._client
+            return await self._restore_client()
+
+    async def _restore_client(self) -> Optional[Client]:
+        """Поднимает клиент из сохранённой сессии (под _client_lock)"""
         # Пробуем загрузить сессию из БД
         async with get_async_session()() as session:
             result = await session.execute(
@@ -403,8 +457,9 @@ class UserbotService:
                 self._auth_state = AuthState.AUTHORIZED
 
                 # Обновляем last_used_at
-                db_session.last_used_at = datetime.utcnow()
+                db_session.last_used_at = _utcnow()
                 await session.commit()
+                self._last_used_touch = time.monotonic()
 
                 logger.info(f"Userbot client restored from session: {db_session.phone_number}")
                 return self._client
@@ -416,6 +471,29 @@ class UserbotService:
                 await session.commit()
                 return None
 
+    def _touch_last_used(self):
+        """Планирует коалесцированное обновление last_used_at (раз в минуту)"""
+        now = time.monotonic()
+        if now - self._last_used_touch < self.LAST_USED_INTERVAL:
+            return
+        self._last_used_touch = now
+        task = asyncio.create_task(self._update_last_used())
+        self._bg_tasks.add(task)
+        task.add_done_callback(self._bg_tasks.discard)
+
+    async def _update_last_used(self):
+        """Одним Core UPDATE помечает активную сессию как использованную"""
+        try:
+            async with get_async_session()() as session:
+                await session.execute(
+                    update(UserbotSession)
+                    .where(UserbotSession.is_active == True)
+                    .values(last_used_at=_utcnow())
+                )
+                await session.commit()
+        except Exception as e:
+            logger.debug(f"last_used_at update failed: {e}")
+
     async def join_channel(self, username: str) -> dict:
         """
         Подписывается на канал.
@@ -461,16 +539,26 @@ class UserbotService:
                 "error": str(e),
             }
 
-    async def download_media(self, chat_username: str, message_id: int) -> Optional[bytes]:
+    async def download_media_to_path(
+        self,
+        chat_username: str,
+        message_id: int,
+        suffix: str = "",
+    ) -> Optional[str]:
         """
-        Скачивает медиа из сообщения канала.
+        Скачивает медиа из сообщения канала во временный файл.
+
+        Большие файлы (видео на десятки МБ) не поднимаются в память
+        целиком — вызывающий читает файл потоково и сам удаляет его
+        после использования.
 
         Args:
             chat_username: Username канала
             message_id: ID сообщения
+            suffix: Расширение временного файла (например ".ogg")
 
         Returns:
-            bytes с данными файла или None
+            Путь к временному файлу или None
         """
         client = await self.get_client()
         if not client:
@@ -486,26 +574,89 @@ class UserbotService:
             message = messages if not isinstance(messages, list) else messages[0]
 
             # Скачиваем медиа во временный файл
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
                 tmp_path = tmp.name
 
             downloaded_path = await client.download_media(message, file_name=tmp_path)
 
             if downloaded_path:
-                with open(downloaded_path, "rb") as f:
-                    data = f.read()
+                logger.info(f"Downloaded media from @{chat_username}/{message_id} to {downloaded_path}")
+                return downloaded_path
 
-                # Удаляем временный файл
-                try:
-                    os.unlink(downloaded_path)
-                except Exception:
-                    pass
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+            return None
 
-                logger.info(f"Downloaded media from @{chat_username}/{message_id}: {len(data)} bytes")
-                return data
+        except FloodWait as e:
+            logger.warning(f"FloodWait downloading from @{chat_username}: wait {e.value}s")
+            return None
+        except Exception as e:
+            logger.error(f"Download media error: {e}")
+            return None
+
+    async def download_media(self, chat_username: str, message_id: int) -> Optional[bytes]:
+        """
+        Скачивает медиа из сообщения канала в память.
+
+        Для мелких файлов (фото), которым нужны именно байты: Pyrogram
+        стримит их сразу в память, без круга через временный файл.
+        Что крупнее IN_MEMORY_LIMIT — скачивается на диск и читается.
+
+        Args:
+            chat_username: Username канала
+            message_id: ID сообщения
 
+        Returns:
+            bytes с данными файла или None
+        """
+        client = await self.get_client()
+        if not client:
+            logger.warning("Cannot download media: userbot not authorized")
             return None
 
+        try:
+            messages = await client.get_messages(chat_username, message_ids=message_id)
+            if not messages:
+                return None
+
+            message = messages if not isinstance(messages, list) else messages[0]
+
+            media = (
+                message.photo or message.voice or message.video_note
+                or message.audio or message.video or message.document
+            )
+            size = getattr(media, "file_size", 0) or 0
+
+            if size > self.IN_MEMORY_LIMIT:
+                # Слишком большой для памяти — через диск
+                with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                    tmp_path = tmp.name
+                downloaded_path = await client.download_media(message, file_name=tmp_path)
+                if not downloaded_path:
+                    try:
+                        os.unlink(tmp_path)
+                    except Exception:
+                        pass
+                    return None
+                try:
+                    with open(downloaded_path, "rb") as f:
+                        data = f.read()
+                finally:
+                    try:
+                        os.unlink(downloaded_path)
+                    except Exception:
+                        pass
+            else:
+                buf = await client.download_media(message, in_memory=True)
+                if buf is None:
+                    return None
+                data = buf.getvalue()
+
+            logger.info(f"Downloaded media from @{chat_username}/{message_id}: {len(data)} bytes")
+            return data
+
         except FloodWait as e:
             logger.warning(f"FloodWait downloading from @{chat_username}: wait {e.value}s")
             return None
@@ -537,53 +688,40 @@ class UserbotService:
         username = username.replace("@", "").strip()
 
         try:
-            messages = []
-            async for message in client.get_chat_history(username, limit=limit):
-                if message.id <= after_id:
-                    break
-
-                msg_data = {
-                    "id": message.id,
-                    "date": message.date,
-                    "text": message.text or message.caption or "",
-                    "has_voice": bool(message.voice),
-                    "has_video_note": bool(message.video_note),
-                    "has_audio": bool(message.audio),
-                    "has_video": bool(message.video),
-                    "has_photo": bool(message.photo),
-                    # Для альбомов (несколько фото/видео в одном посте)
-                    "media_group_id": message.media_group_id,
-                }
-
-                # Собираем все типы медиа в посте
-                media_types = []
-
-                if message.voice:
-                    media_types.append("voice")
-                    msg_data["voice_duration"] = message.voice.duration
-                if message.video_note:
-                    media_types.append("video_note")
-                    msg_data["video_note_duration"] = message.video_note.duration
-                if message.audio:
-                    media_types.append("audio")
-                    msg_data["audio_duration"] = message.audio.duration
-                if message.video:
-                    media_types.append("video")
-                    msg_data["video_duration"] = message.video.duration if message.video.duration else None
-                if message.photo:
-                    media_types.append("photo")
-                    # Берём самое большое разрешение фото
-                    msg_data["photo_file_id"] = message.photo.file_id
-
-                # Для обратной совместимости - основной тип медиа
-                if media_types:
-                    msg_data["media_type"] = media_types[0]
-                    msg_data["all_media_types"] = media_types
-                else:
-                    msg_data["media_type"] = "text"
-                    msg_data["all_media_types"] = []
-
-                messages.append(msg_data)
+            if after_id > 0:
+                # Диапазон ID известен — забираем его одним MTProto-
+                # запросом вместо постраничной итерации по истории.
+                # Удалённые/служебные ID приходят пустыми сообщениями
+                fetched = await client.get_messages(
+                    username,
+                    message_ids=list(range(after_id + 1, after_id + limit + 1)),
+                )
+                if not isinstance(fetched, list):
+                    fetched = [fetched]
+                messages = [
+                    self._message_to_dict(m)
+                    for m in fetched
+                    if m and not getattr(m, "empty", False)
+                ]
+                if not messages:
+                    # Весь диапазон пуст: либо новых постов нет, либо
+                    # все ID окна удалены, а свежие посты лежат дальше —
+                    # тогда без проверки канал застрянет перед «дырой»
+                    # навсегда. Дешёвый probe истории различает случаи
+                    newest = [m async for m in client.get_chat_history(username, limit=1)]
+                    if newest and newest[0].id > after_id:
+                        messages = [
+                            self._message_to_dict(m)
+                            async for m in client.get_chat_history(username, limit=limit)
+                            if m.id > after_id
+                        ]
+            else:
+                # Точка отсчёта неизвестна (after_id == 0) — берём
+                # свежие из истории; фильтровать на клиенте нечего
+                messages = [
+                    self._message_to_dict(message)
+                    async for message in client.get_chat_history(username, limit=limit)
+                ]
 
             logger.info(f"Got {len(messages)} messages from @{username}")
             return messages
@@ -599,6 +737,60 @@ class UserbotService:
             logger.error(f"Get channel messages error: {e}")
             return []
 
+    @staticmethod
+    def _message_to_dict(message) -> dict:
+        """Проецирует Pyrogram-сообщение в плоский dict с метаданными"""
+        # Локальные алиасы: у Pyrogram каждое обращение к атрибуту
+        # медиа — лукап по объекту модели, не повторяем их по 3 раза
+        voice = message.voice
+        video_note = message.video_note
+        audio = message.audio
+        video = message.video
+        photo = message.photo
+
+        msg_data = {
+            "id": message.id,
+            "date": message.date,
+            "text": message.text or message.caption or "",
+            "has_voice": bool(voice),
+            "has_video_note": bool(video_note),
+            "has_audio": bool(audio),
+            "has_video": bool(video),
+            "has_photo": bool(photo),
+            # Для альбомов (несколько фото/видео в одном посте)
+            "media_group_id": message.media_group_id,
+        }
+
+        # Собираем все типы медиа в посте
+        media_types = []
+
+        if voice:
+            media_types.append("voice")
+            msg_data["voice_duration"] = voice.duration
+        if video_note:
+            media_types.append("video_note")
+            msg_data["video_note_duration"] = video_note.duration
+        if audio:
+            media_types.append("audio")
+            msg_data["audio_duration"] = audio.duration
+        if video:
+            media_types.append("video")
+            msg_data["video_duration"] = video.duration if video.duration else None
+        if photo:
+            media_types.append("photo")
+            # Берём самое большое разрешение фото
+            msg_data["photo_file_id"] = photo.file_id
+
+        # Для обратной совместимости - основной тип медиа
+        if media_types:
+            msg_data["media_type"] = media_types[0]
+            msg_data["all_media_types"] = media_types
+        else:
+            msg_data["media_type"] = "text"
+            msg_data["all_media_types"] = []
+
+        return msg_data
+
     async def download_photo(self, chat_username: str, message_id: int) -> Optional[bytes]:
         """
         Скачивает фото из сообщения канала.
@@ -618,20 +810,20 @@ class UserbotService:
             if self._client and self._client.is_connected:
                 await self._client.stop()
 
-            # Деактивируем сессию в БД
+            # Деактивируем сессию в БД одним UPDATE
             async with get_async_session()() as session:
-                result = await session.execute(
-                    select(UserbotSession).where(UserbotSession.is_active == True)
+                await session.execute(
+                    update(UserbotSession)
+                    .where(UserbotSession.is_active == True)
+                    .values(is_active=False, is_authorized=False)
                 )
-                for db_session in result.scalars().all():
-                    db_session.is_active = False
-                    db_session.is_authorized = False
                 await session.commit()
 
             self._client = None
             self._auth_state = AuthState.NOT_STARTED
             self._current_phone = None
             self._phone_code_hash = None
+            self._last_used_touch = 0.0
 
             logger.info("Userbot logged out")
 